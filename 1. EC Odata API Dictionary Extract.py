@@ -1,11 +1,22 @@
-import requests
-from requests.auth import HTTPBasicAuth
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import xml.etree.ElementTree as ET
 import pandas as pd
-import re
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Border, Side
+import json
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 import os
+import sys
+from sf_store import write_sheet, read_sheet
+from sf_entities import resolve_entity_sets, Progress
+from sf_http import build_session
+from sf_replay import use_http_mode
+from sf_style import register_styles
+from sf_metadata_cache import MetadataCache, conditional_headers, fetch_service_metadata
+from sf_metadata import (
+    entityset_cols, tree_records, parse_metadata_stream, index_service_metadata, slice_service_metadata,
+    records_fingerprint, extract_dictionary
+)
 
 # API variables
 API_SERVER = "apiDemo.successfactors.com"
@@ -16,126 +27,254 @@ ENTITY_SETS = [
     "PaymentInformationDetailV3", "Background_OutsideWorkExperience", "Background_Education",
     "Background_Certificates", "Background_Languages"
 ]
+DISCOVER_ENTITIES = False  # True: read all entity sets (including custom cust_* objects) from the service document instead of ENTITY_SETS
+ENTITY_INCLUDE = ["*"]  # With DISCOVER_ENTITIES, wildcard patterns of entity sets to export, e.g. ["Emp*", "Per*", "cust_*"]
+ENTITY_EXCLUDE = []  # With DISCOVER_ENTITIES, wildcard patterns of entity sets to leave out, e.g. ["*_Audit"]
 USERNAME = "Berg@ComopanyId"
 PASSWORD = "Berg"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 EXCEL_OUTPUT_PATH = os.path.join(SCRIPT_DIR, "EC_APIField_Metadata.xlsx") # <-- moved here
+PIPELINE_STORE = os.path.join(SCRIPT_DIR, "SF_API_Pipeline.sqlite")  # Tables handed to the next scripts instead of the workbook
+MAX_WORKERS = 8  # Concurrent $metadata downloads sharing one connection pool (1 = sequential)
+REQUEST_TIMEOUT = 120  # Seconds per $metadata request
+USE_METADATA_CACHE = True  # Keep raw $metadata on disk and revalidate it with conditional requests
+METADATA_CACHE_DIR = os.path.join(SCRIPT_DIR, ".metadata_cache")
+METADATA_CACHE_TTL = 24 * 3600  # Seconds before a cached document is dropped and downloaded in full again
+METADATA_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used documents are evicted above this size
+PARSE_MODE = "stream"  # "stream" parses $metadata incrementally and keeps only extracted records; "tree" keeps full ElementTrees
+METADATA_SOURCE = "entity"  # "entity": one /{entity}/$metadata call per entity; "service": download /$metadata once and slice it locally
+SERVICE_METADATA_MAX_BYTES = 256 * 1024 * 1024  # Larger service documents fall back to per-entity downloads
+INCREMENTAL = True  # Re-extract only entities whose metadata fingerprint changed and merge them into the existing Excel file
+MANIFEST_PATH = os.path.join(SCRIPT_DIR, "EC_APIField_Metadata.manifest.json")
+CHANGE_REPORT_PATH = os.path.join(SCRIPT_DIR, "EC_APIField_Metadata Changes.csv")
+UNCHANGED = "unchanged"  # Returned instead of parsed metadata when an entity's fingerprint matches the last extract
+HTTP_MODE = "live"  # "live", "record" (save every exchange), "replay" (offline from CASSETTE_DIR) or "mock" (see sf_replay.py)
+CASSETTE_DIR = os.path.join(SCRIPT_DIR, "http_cassettes")
+MOCK_SERVER = "127.0.0.1:8765"  # Address of sf_mock_server.py for HTTP_MODE = "mock"
 
-# Download and parse metadata for each entity set
-metadata_trees = {}
-for entity in ENTITY_SETS:
+class TeeReader:
+    """File-like wrapper that copies everything read from the response into the cache file."""
+    def __init__(self, source, sink):
+        self.source = source
+        self.sink = sink
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.sink.write(data)
+        return data
+
+def fetch_metadata(session, entity):
     url = f"https://{API_SERVER}/odata/v2/{entity}/$metadata"
     print(f"Fetching metadata for {entity}...")
-    response = requests.get(url, auth=HTTPBasicAuth(USERNAME, PASSWORD), verify=True)
-    if response.status_code == 200:
-        metadata_trees[entity] = ET.ElementTree(ET.fromstring(response.content))
-    else:
-        print(f"Failed to fetch metadata for {entity}: {response.status_code}")
-
-ns = {
-    'edmx': 'http://schemas.microsoft.com/ado/2007/06/edmx',
-    'm': 'http://schemas.microsoft.com/ado/2007/08/dataservices/metadata',
-    '': 'http://schemas.microsoft.com/ado/2008/09/edm',
-    'sap': 'http://www.successfactors.com/edm/sap'
-}
+    cached = metadata_cache.load(entity) if USE_METADATA_CACHE else None
+    response = session.get(url, headers=conditional_headers(cached), timeout=REQUEST_TIMEOUT, stream=PARSE_MODE == "stream")
+    xml_path = metadata_cache.paths(entity)[0]
+    if response.status_code == 304 and cached:
+        print(f"Metadata for {entity} not modified, using cached copy")
+        os.utime(xml_path)  # Mark as recently used for eviction
+        if cached.get("fingerprint") and cached["fingerprint"] == previous_fingerprints.get(entity):
+            return UNCHANGED  # Same document as in the last extract, no need to parse it again
+        if PARSE_MODE == "stream":
+            with open(xml_path, "rb") as f:
+                return list(parse_metadata_stream(f, seen_types))
+        return ET.parse(xml_path)
+    if response.status_code != 200:
+        response.close()
+        raise RuntimeError(response.status_code)
+    if PARSE_MODE == "stream":
+        response.raw.decode_content = True
+        if not USE_METADATA_CACHE:
+            with response:
+                return list(parse_metadata_stream(response.raw, seen_types))
+        os.makedirs(METADATA_CACHE_DIR, exist_ok=True)
+        with response, open(xml_path + ".tmp", "wb") as sink:
+            records = list(parse_metadata_stream(TeeReader(response.raw, sink), seen_types))
+            sink.write(response.raw.read())  # Anything after the root element the parser did not consume
+        metadata_cache.commit(entity, response, records_fingerprint(records))
+        return records
+    if USE_METADATA_CACHE:
+        os.makedirs(METADATA_CACHE_DIR, exist_ok=True)
+        with open(xml_path + ".tmp", "wb") as f:
+            f.write(response.content)
+        metadata_cache.commit(entity, response)
+    return ET.ElementTree(ET.fromstring(response.content))
+
+def fetch_all_metadata(entities):
+    results = {}
+    errors = {}
+    session = use_http_mode(build_session(USERNAME, PASSWORD, MAX_WORKERS), HTTP_MODE, CASSETTE_DIR, MOCK_SERVER, MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        futures = {pool.submit(fetch_metadata, session, entity): entity for entity in entities}
+        progress = Progress("Metadata", len(futures))
+        for future in as_completed(futures):
+            entity = futures[future]
+            try:
+                results[entity] = future.result()
+            except Exception as e:
+                errors[entity] = str(e)
+                print(f"Failed to fetch metadata for {entity}: {e}")
+            progress.update(failed=entity in errors)
+    session.close()
+    # Keep ENTITY_SETS order so the output matches a sequential run
+    return {entity: results[entity] for entity in entities if entity in results}, errors
+
+def slice_service_metadata_for(entities):
+    # Returns the records of every entity found in the service document; an empty result means "fetch per entity"
+    session = use_http_mode(build_session(USERNAME, PASSWORD, MAX_WORKERS), HTTP_MODE, CASSETTE_DIR, MOCK_SERVER, MAX_WORKERS)
+    print("Fetching service metadata...")
+    try:
+        xml_path, temporary = fetch_service_metadata(
+            lambda url, headers: session.get(url, headers=headers, timeout=REQUEST_TIMEOUT, stream=True),
+            f"https://{API_SERVER}/odata/v2/$metadata", metadata_cache, SERVICE_METADATA_MAX_BYTES, USE_METADATA_CACHE
+        )
+    except Exception as e:
+        print(f"Service metadata unavailable ({e}), falling back to per-entity downloads")
+        return {}
+    finally:
+        session.close()
+    with open(xml_path, "rb") as f:
+        index = index_service_metadata(f)
+    with open(xml_path, "rb") as f:
+        records = slice_service_metadata(f, index, entities, seen_types)
+    if temporary:
+        os.remove(xml_path)
+    print(f"Sliced metadata for {len(records)} of {len(entities)} entities from the service document")
+    return records
+
+def load_manifest():
+    # Fingerprints of the last extract; only usable if it was made for the same server and user and its output still exists
+    if not INCREMENTAL or not os.path.exists(EXCEL_OUTPUT_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("server") != API_SERVER or manifest.get("user") != USERNAME:
+        return {}
+    return manifest.get("entities", {})
+
+def save_manifest(fingerprints):
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump({"server": API_SERVER, "user": USERNAME, "entities": fingerprints}, f, indent=2)
+
+def join_requesters(*values):
+    # Merge "RequestedBy" cells, keeping ENTITY_SETS order
+    names = {name for value in values for name in value.split(", ") if name}
+    order = {name: i for i, name in enumerate(ENTITY_SETS)}
+    return ", ".join(sorted(names, key=lambda name: order.get(name, len(order))))
+
+def merge_incremental(old_entities, old_dict, new_entities, new_dict, refreshed):
+    # Rows of refreshed (re-extracted or removed) entities are replaced; everything else is kept from the last extract
+    order = {name: i for i, name in enumerate(ENTITY_SETS)}
+    merged_entities = pd.concat([old_entities[~old_entities["Name"].isin(refreshed)], new_entities], ignore_index=True)
+    merged_entities = merged_entities.sort_values("Name", key=lambda col: col.map(lambda name: order.get(name, len(order))), kind="stable")
+
+    old_dict = old_dict.copy()
+    old_dict["RequestedBy"] = old_dict["RequestedBy"].map(
+        lambda value: ", ".join(name for name in value.split(", ") if name and name not in refreshed)
+    )
+    new_by_type = {name: rows for name, rows in new_dict.groupby("Entity", sort=False)}
+    blocks = []
+    for name, rows in old_dict.groupby("Entity", sort=False):
+        if name in new_by_type:
+            # Re-extracted types take the place of their old rows and keep their remaining requesters
+            rows_new = new_by_type.pop(name).copy()
+            rows_new["RequestedBy"] = join_requesters(rows["RequestedBy"].iloc[0], rows_new["RequestedBy"].iloc[0])
+            blocks.append(rows_new)
+        elif rows["RequestedBy"].iloc[0]:
+            blocks.append(rows)
+    blocks.extend(new_by_type.values())
+    merged_dict = pd.concat(blocks, ignore_index=True) if blocks else new_dict
+    extra = ["Key", "Entity", "NavigationField", "RequestedBy"]
+    attrs = sorted(col for col in merged_dict.columns if col not in extra)
+    merged_dict = merged_dict.reindex(columns=attrs + extra).fillna("Null")
+    return merged_entities.reset_index(drop=True), merged_dict
+
+def read_previous_sheet(sheet_name):
+    # From the pipeline store while it mirrors the current workbook, otherwise from the workbook itself
+    stored = read_sheet(PIPELINE_STORE, EXCEL_OUTPUT_PATH, sheet_name)
+    if stored is None:
+        return pd.read_excel(EXCEL_OUTPUT_PATH, sheet_name=sheet_name, dtype=str, keep_default_na=False)
+    headers, rows = stored
+    return pd.DataFrame(rows, columns=headers, dtype=str)
+
+def property_changes(old_dict, new_dict):
+    # Added, removed and modified properties between two dictionaries, keyed by (Entity, Name)
+    key = ["Entity", "Name"]
+    attrs = sorted((set(old_dict.columns) | set(new_dict.columns)) - set(key) - {"RequestedBy"})
+    old = old_dict.reindex(columns=key + attrs, fill_value="Null").drop_duplicates(key).set_index(key)
+    new = new_dict.reindex(columns=key + attrs, fill_value="Null").drop_duplicates(key).set_index(key)
+    report = [("added",) + k + ("",) for k in new.index.difference(old.index)]
+    report += [("removed",) + k + ("",) for k in old.index.difference(new.index)]
+    common = old.index.intersection(new.index)
+    old, new = old.loc[common], new.loc[common]
+    differs = old.ne(new)
+    for k in differs.index[differs.any(axis=1)]:
+        cols = differs.columns[differs.loc[k]]
+        report.append(("modified",) + k + ("; ".join(f"{col}: {old.at[k, col]} -> {new.at[k, col]}" for col in cols),))
+    return pd.DataFrame(report, columns=["Change", "Entity", "Name", "Details"]).sort_values(key).reset_index(drop=True)
+
+# Entity sets to export: the configured list, or every entity set the service document lists
+discovery_session = use_http_mode(build_session(USERNAME, PASSWORD, MAX_WORKERS), HTTP_MODE, CASSETTE_DIR, MOCK_SERVER, MAX_WORKERS)
+ENTITY_SETS = resolve_entity_sets(
+    discovery_session, API_SERVER, REQUEST_TIMEOUT, ENTITY_SETS, DISCOVER_ENTITIES, ENTITY_INCLUDE, ENTITY_EXCLUDE
+)
+discovery_session.close()
+
+# Download and parse metadata for each entity set
+previous_fingerprints = load_manifest()
+metadata_cache = MetadataCache(METADATA_CACHE_DIR, API_SERVER, USERNAME, METADATA_CACHE_TTL, METADATA_CACHE_MAX_BYTES)
+seen_types = {}  # EntityType content hash -> parsed record, shared by all downloads so each distinct type is parsed once
+metadata_records = slice_service_metadata_for(ENTITY_SETS) if METADATA_SOURCE == "service" else {}
+remaining = [entity for entity in ENTITY_SETS if entity not in metadata_records]
+fetched, fetch_errors = fetch_all_metadata(remaining) if remaining else ({}, {})
+unchanged = [entity for entity, result in fetched.items() if result is UNCHANGED]
+fetched = {entity: result for entity, result in fetched.items() if result is not UNCHANGED}
+if USE_METADATA_CACHE:
+    metadata_cache.evict()
+if fetch_errors:
+    print(f"Metadata could not be fetched for {len(fetch_errors)} of {len(ENTITY_SETS)} entities:")
+    for entity, error in fetch_errors.items():
+        print(f"  {entity}: {error}")
 
-def get_text(node, tag):
-    el = node.find(tag, ns)
-    return el.text if el is not None else "Null"
-
-def get_sap_tags(doc):
-    tags = doc.find('.//sap:tagcollection', ns)
-    if tags is not None:
-        return ', '.join([t.text for t in tags.findall('sap:tag', ns)])
-    return "Null"
-
-def get_attr_value(node, attr):
-    if attr in node.attrib:
-        return node.attrib[attr]
-    if 'sap:' + attr in node.attrib:
-        return node.attrib['sap:' + attr]
-    sap_ns = '{http://www.successfactors.com/edm/sap}' + attr
-    if sap_ns in node.attrib:
-        return node.attrib[sap_ns]
-    return "Null"
-
-def clean_attr(attr):
-    return re.sub(r'^\{.*\}', '', attr).replace('sap:', '')
-
-# 1. EC Entity Sheet (collect from all metadata trees)
-entities = []
-entityset_cols = ['Name', 'label', 'creatable', 'updatable', 'upsertable', 'deletable']
-for tree in metadata_trees.values():
-    root = tree.getroot()
-    for schema in root.findall('.//{http://schemas.microsoft.com/ado/2008/09/edm}Schema'):
-        if schema.attrib.get('Namespace') == 'SFODataSet':
-            for es in schema.findall('.//EntitySet', ns):
-                doc = es.find('Documentation', ns)
-                summary = get_text(doc, 'Summary') if doc is not None else "Null"
-                longdesc = get_text(doc, 'LongDescription') if doc is not None else "Null"
-                tags = get_sap_tags(doc) if doc is not None else "Null"
-                row = {}
-                for col in entityset_cols:
-                    if col == 'Name':
-                        row['Name'] = es.attrib.get('Name', 'Null')
-                    else:
-                        row[col] = get_attr_value(es, col)
-                row['Summary'] = summary
-                row['LongDescription'] = longdesc
-                row['Sap Tagcollection'] = tags
-                entities.append(row)
+# In "stream" mode only the extracted records are kept; in "tree" mode the full trees of the per-entity
+# downloads stay available as before (slices of the service document are always streamed)
+if PARSE_MODE == "stream":
+    metadata_records.update(fetched)
+else:
+    metadata_trees = fetched
+    metadata_records.update({entity: list(tree_records(tree, seen_types)) for entity, tree in metadata_trees.items()})
+metadata_records = {entity: metadata_records[entity] for entity in ENTITY_SETS if entity in metadata_records}
 
+# Unchanged and unreachable entities keep the fingerprint (and rows) of the last extract
+fingerprints = {entity: previous_fingerprints[entity] for entity in ENTITY_SETS
+                if entity in previous_fingerprints and entity not in metadata_records}
+fingerprints.update({entity: records_fingerprint(records) for entity, records in metadata_records.items()})
+refreshed = [entity for entity in metadata_records if fingerprints[entity] != previous_fingerprints.get(entity)]
+requested = set(ENTITY_SETS)
+removed = [entity for entity in previous_fingerprints if entity not in requested]
+if previous_fingerprints:
+    print(f"{len(refreshed)} entities changed, {len(removed)} removed, "
+          f"{len(ENTITY_SETS) - len(refreshed) - len(fetch_errors)} unchanged since the last extract")
+    if not refreshed and not removed:
+        print(f"Excel file '{EXCEL_OUTPUT_PATH}' is up to date.")
+        sys.exit(0)
+    metadata_records = {entity: metadata_records[entity] for entity in refreshed}
+
+# 1. EC Entity Sheet and 2. EC Data API Dictionary Sheet, built in one pass over all metadata records
+entities, dict_columns = extract_dictionary(metadata_records)
 df_entities = pd.DataFrame(entities, columns=entityset_cols + ['Summary', 'LongDescription', 'Sap Tagcollection'])
+df_dict = pd.DataFrame(dict_columns, columns=list(dict_columns))
 
-# 2. EC Data API Dictionary Sheet (collect from all metadata trees)
-rows = []
-all_attrs = set()
-
-for tree in metadata_trees.values():
-    root = tree.getroot()
-    for schema in root.findall('.//{http://schemas.microsoft.com/ado/2008/09/edm}Schema'):
-        if schema.attrib.get('Namespace') == 'SFOData':
-            for et in schema.findall('EntityType', ns):
-                for prop in et.findall('Property', ns):
-                    all_attrs.update([clean_attr(a) for a in prop.attrib.keys()])
-                for nav in et.findall('NavigationProperty', ns):
-                    all_attrs.update([clean_attr(a) for a in nav.attrib.keys()])
-
-all_attrs = sorted(all_attrs)
-all_attrs += ["Key", "Entity", "NavigationField"]
-
-for tree in metadata_trees.values():
-    root = tree.getroot()
-    for schema in root.findall('.//{http://schemas.microsoft.com/ado/2008/09/edm}Schema'):
-        if schema.attrib.get('Namespace') == 'SFOData':
-            for et in schema.findall('EntityType', ns):
-                entity_name = et.attrib.get('Name', 'Null')
-                key_names = set()
-                key = et.find('Key', ns)
-                if key is not None:
-                    key_names = {pr.attrib.get('Name') for pr in key.findall('PropertyRef', ns)}
-                for prop in et.findall('Property', ns):
-                    row = {}
-                    for attr in all_attrs:
-                        if attr in ["Key", "Entity", "NavigationField"]:
-                            continue
-                        row[attr] = get_attr_value(prop, attr)
-                    row["Key"] = "true" if prop.attrib.get("Name") in key_names else "false"
-                    row["Entity"] = entity_name
-                    row["NavigationField"] = "false"
-                    rows.append(row)
-                for nav in et.findall('NavigationProperty', ns):
-                    row = {}
-                    for attr in all_attrs:
-                        if attr in ["Key", "Entity", "NavigationField"]:
-                            continue
-                        row[attr] = get_attr_value(nav, attr)
-                    row["Key"] = "false"
-                    row["Entity"] = entity_name
-                    row["NavigationField"] = "true"
-                    rows.append(row)
-
-df_dict = pd.DataFrame(rows, columns=all_attrs)
+if previous_fingerprints:
+    old_sheets = {sheet_name: read_previous_sheet(sheet_name) for sheet_name in ["EC Entity", "EC Data API Dictionary"]}
+    df_entities, df_dict = merge_incremental(
+        old_sheets["EC Entity"], old_sheets["EC Data API Dictionary"], df_entities, df_dict, set(refreshed + removed)
+    )
+    changes = property_changes(old_sheets["EC Data API Dictionary"], df_dict)
+    changes.to_csv(CHANGE_REPORT_PATH, index=False, encoding="utf-8-sig")
+    print(f"{len(changes)} property changes written to '{CHANGE_REPORT_PATH}'")
 
 # 3. Simple EC Data API Dictionary Sheet
 simple_cols = [
@@ -160,36 +299,45 @@ df_simple = df_simple.sort_values(
     key=lambda col: col.map(lambda x: 1 if str(x).lower() == "true" else 0) if col.name in ["Key", "required"] else col
 ).reset_index(drop=True)
 
-# 4. Write to Excel
-with pd.ExcelWriter(EXCEL_OUTPUT_PATH, engine="openpyxl") as writer:
-    df_entities.to_excel(writer, sheet_name="EC Entity", index=False)
-    df_dict.to_excel(writer, sheet_name="EC Data API Dictionary", index=False)
-    df_simple.to_excel(writer, sheet_name="Simple EC Data API Dictionary", index=False)
-
-# 5. Formatting with openpyxl
-wb = load_workbook(EXCEL_OUTPUT_PATH)
-green_fill = PatternFill(start_color="90EE90", end_color="90EE90", fill_type="solid")
-thin = Side(border_style="thin", color="000000")
-
-for ws in wb.worksheets:
-    # Autofit columns
-    for col in ws.columns:
-        max_length = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        ws.column_dimensions[col_letter].width = max_length + 2
-    # Add border and green fill for header
-    for row in ws.iter_rows():
-        for cell in row:
-            if cell.value is not None and cell.row == 1:
-                cell.fill = green_fill
-            if cell.value is not None:
-                cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-wb.save(EXCEL_OUTPUT_PATH)
+# 4. Write to Excel, styled while streaming: one pass, no reload of the saved workbook
+def column_widths(df):
+    # Longest rendered value per column, header included, computed on the whole column at once
+    lengths = df.fillna("").astype(str).apply(lambda col: col.str.len().max() if len(col) else 0)
+    return [max(len(str(name)), int(length)) + 2 for name, length in zip(df.columns, lengths)]
+
+def write_excel(path, sheets):
+    wb = Workbook(write_only=True)
+    header_style, body_style = register_styles(wb, header_color="90EE90", bold_header=True)
+    for sheet_name, df in sheets.items():
+        ws = wb.create_sheet(sheet_name)
+        for i, width in enumerate(column_widths(df), start=1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+        header = []
+        for name in df.columns:
+            cell = WriteOnlyCell(ws, value=name)
+            cell.style = header_style
+            header.append(cell)
+        ws.append(header)
+        for values in df.itertuples(index=False, name=None):
+            row = []
+            for value in values:
+                if value is None or (isinstance(value, float) and pd.isna(value)):
+                    row.append(None)
+                    continue
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = body_style
+                row.append(cell)
+            ws.append(row)
+    wb.save(path)
+
+sheets = {
+    "EC Entity": df_entities,
+    "EC Data API Dictionary": df_dict,
+    "Simple EC Data API Dictionary": df_simple,
+}
+write_excel(EXCEL_OUTPUT_PATH, sheets)
+for sheet_name, df in sheets.items():
+    write_sheet(PIPELINE_STORE, EXCEL_OUTPUT_PATH, sheet_name, df.columns, df.itertuples(index=False, name=None))
+if INCREMENTAL:
+    save_manifest(fingerprints)
 print(f"Excel file '{EXCEL_OUTPUT_PATH}' created successfully.")
\ No newline at end of file
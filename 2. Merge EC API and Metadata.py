@@ -1,37 +1,25 @@
 import openpyxl
-from openpyxl.styles import PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 import os
 import json
+import pandas as pd
+from sf_store import read_sheet, write_sheet, load_sheet
+from sf_rules import load_rules, compile_rules, removal_reasons
+from sf_style import autofit_and_style
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+UPSET_FILE = os.path.join(SCRIPT_DIR, "SF New Hire API UpsertV1.xlsx")  # Script 3 output, saved again with the metadata columns
+DICT_FILE = os.path.join(SCRIPT_DIR, "EC_APIField_Metadata.xlsx")
+ATTR_FILE = os.path.join(SCRIPT_DIR, "Employee Central API AttributeV2.xlsx")
+NEW_FILE = os.path.join(SCRIPT_DIR, "New Hire API DocumentV1.xlsx")  # Final document, read by script 4
+PIPELINE_STORE = os.path.join(SCRIPT_DIR, "SF_API_Pipeline.sqlite")
+RULES_FILE = os.path.join(SCRIPT_DIR, "upsert_field_rules.json")  # Which fields to remove, see sf_rules.py
+REMOVED_REPORT = os.path.join(SCRIPT_DIR, "New Hire API Removed Fields.csv")
 
 def capitalize_headers(ws):
     for cell in ws[1]:
         if cell.value:
             cell.value = str(cell.value).capitalize()
 
-def autofit_and_style(ws):
-    green_fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
-    thin = Side(border_style="thin", color="000000")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-    # Autofit columns
-    for col in ws.columns:
-        max_length = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
-            cell.border = border  # Always apply border
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = max_length + 2
-    # Set a reasonable row height for all rows with value
-    for row in ws.iter_rows():
-        has_value = any(cell.value for cell in row)
-        if has_value:
-            ws.row_dimensions[row[0].row].height = 18
-    # Green header
-    for cell in ws[1]:
-        if cell.value:
-            cell.fill = green_fill
-
 def reorder_columns(ws, desired_order):
     headers = [cell.value for cell in ws[1]]
     headers_lower = [str(h).lower() if h else "" for h in headers]
@@ -48,23 +36,43 @@ def reorder_columns(ws, desired_order):
 
     # Build new rows with columns in the desired order
     all_rows = list(ws.iter_rows(values_only=True))
-    ws.delete_rows(1, ws.max_row)
-    for row in all_rows:
-        new_row = [row[i] if i < len(row) else "" for i in ordered_indices]
-        ws.append(new_row)
-
-def enrich_upsert_sheet_with_dictionary():
-    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-    UPSET_FILE = os.path.join(SCRIPT_DIR, "SF New Hire API UpsertV1.xlsx")
-    DICT_FILE = os.path.join(SCRIPT_DIR, "EC_APIField_Metadata.xlsx")
-
-    wb_upsert = openpyxl.load_workbook(UPSET_FILE)
+    rewrite_rows(ws, [[row[i] if i < len(row) else "" for i in ordered_indices] for row in all_rows])
+
+def rewrite_rows(ws, rows, min_row=1):
+    # Writes rows over the sheet from min_row down and drops what is left below them in a single delete_rows call.
+    # Cells keep their styles; deleting rows one at a time would shift every row below each deleted one.
+    width = ws.max_column
+    for r, row in enumerate(rows, start=min_row):
+        for c in range(1, max(width, len(row)) + 1):
+            ws.cell(row=r, column=c).value = row[c - 1] if c <= len(row) else None
+    end = min_row + len(rows)
+    if ws.max_row >= end:
+        ws.delete_rows(end, ws.max_row - end + 1)
+
+def workbook_from_store(store_path, workbook_path, sheet_names, optional_names=()):
+    # Rebuilds a workbook from its stored sheets, or returns None if any of them is older than the workbook.
+    # Optional sheets (written only by some runs) are added when their table is current. The store keeps only
+    # values, so each sheet gets the styling script 3 gave it (header fill, borders, column widths) again.
+    sheets = [read_sheet(store_path, workbook_path, name) for name in sheet_names]
+    if any(sheet is None for sheet in sheets):
+        return None
+    optional = [(name, read_sheet(store_path, workbook_path, name)) for name in optional_names]
+    sheet_names = list(sheet_names) + [name for name, sheet in optional if sheet is not None]
+    sheets += [sheet for name, sheet in optional if sheet is not None]
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for name, (headers, rows) in zip(sheet_names, sheets):
+        ws = wb.create_sheet(name)
+        ws.append(headers)
+        for row in rows:
+            ws.append(row)
+        autofit_and_style(ws, fill_empty_header=True)
+    return wb
+
+def enrich_upsert_sheet_with_dictionary(wb_upsert):
     ws_upsert = wb_upsert["Upsert API Field Attribute"]
 
-    wb_dict = openpyxl.load_workbook(DICT_FILE, data_only=True)
-    ws_dict = wb_dict["Simple EC Data API Dictionary"]
-
-    dict_headers = [cell.value for cell in ws_dict[1]]
+    dict_headers, dict_rows = load_sheet(PIPELINE_STORE, DICT_FILE, "Simple EC Data API Dictionary")
     lookup_cols = ["label","Type", "Key", "required", "picklist", "MaxLength", "NavigationField", "visible", "filterable", "sortable", "upsertable","creatable", "updatable"]
     entity_idx = dict_headers.index("Entity")
     name_idx = dict_headers.index("Name")
@@ -72,7 +80,7 @@ def enrich_upsert_sheet_with_dictionary():
     col_indices = [dict_headers_lower.index(col.lower()) for col in lookup_cols]
 
     lookup = {}
-    for row in ws_dict.iter_rows(min_row=2, values_only=True):
+    for row in dict_rows:
         key = (str(row[entity_idx]), str(row[name_idx]))
         values = [row[i] for i in col_indices]
         lookup[key] = values
@@ -94,28 +102,16 @@ def enrich_upsert_sheet_with_dictionary():
     # desired_order = ["Entity", "Field", "Label","Type", "Key", "Required", "Picklist", "MaxLength", "Sample Value","Creatable", "Updatable", "NavigationField", "Visible", "Filterable", "Sortable", "Upsertable"]
     # reorder_columns(ws_upsert, desired_order)
     capitalize_headers(ws_upsert)
-    autofit_and_style(ws_upsert)
-    wb_upsert.save(UPSET_FILE)
+    autofit_and_style(ws_upsert, row_height=18)
     print("Upsert API Field Attribute sheet enriched with metadata columns.")
 
-def enrich_api_entity_sheet():
-    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-    UPSET_FILE = os.path.join(SCRIPT_DIR, "SF New Hire API UpsertV1.xlsx")
-    NEW_FILE = os.path.join(SCRIPT_DIR, "New Hire API DocumentV1.xlsx")
-    EC_METADATA_FILE = os.path.join(SCRIPT_DIR, "EC_APIField_Metadata.xlsx")
-    ATTR_FILE = os.path.join(SCRIPT_DIR, "Employee Central API AttributeV2.xlsx")
-
-    wb_upsert = openpyxl.load_workbook(UPSET_FILE)
+def enrich_api_entity_sheet(wb_upsert):
     ws_api_entity = wb_upsert["API Entity"]
 
-    wb_ecmeta = openpyxl.load_workbook(EC_METADATA_FILE, data_only=True)
-    ws_ec_entity = wb_ecmeta["EC Entity"]
-
-    wb_attr = openpyxl.load_workbook(ATTR_FILE, data_only=True)
-    ws_person_emp = wb_attr["Person+Employment"]
+    # The attribute workbook is streamed once and then read from the pipeline store until it changes
+    attr_headers, attr_rows = load_sheet(PIPELINE_STORE, ATTR_FILE, "Person+Employment")
 
     # --- Build lookups ---
-    attr_headers = [cell.value for cell in ws_person_emp[1]]
     attr_headers_lower = [str(h).lower() if h else "" for h in attr_headers]
     attr_cols = ["Introduction", "BusinessKeys", "Effective-Date", "PersonEntityElement"]
     attr_indices = [attr_headers_lower.index(col.lower()) for col in attr_cols]
@@ -123,7 +119,7 @@ def enrich_api_entity_sheet():
 
     # Build a lookup for entity -> values
     attr_lookup = {}
-    for row in ws_person_emp.iter_rows(min_row=2, values_only=True):
+    for row in attr_rows:
         key = str(row[attr_entity_idx]).lower()  # Lowercase for case-insensitive match
         values = [row[i] for i in attr_indices]
         attr_lookup[key] = values
@@ -152,15 +148,10 @@ def enrich_api_entity_sheet():
                     ws_api_entity.cell(row=row[0].row, column=col_idx, value=val)
 
     capitalize_headers(ws_api_entity)
-    autofit_and_style(ws_api_entity)
-    # Save to new file
-    wb_upsert.save(NEW_FILE)
-    print(f"API Entity sheet enriched and exported to {NEW_FILE}")
-
-def clean_upsert_and_api_sample():
-    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-    UPSET_FILE = os.path.join(SCRIPT_DIR, "New Hire API DocumentV1.xlsx")
-    wb = openpyxl.load_workbook(UPSET_FILE)
+    autofit_and_style(ws_api_entity, row_height=18)
+    print("API Entity sheet enriched with entity attributes.")
+
+def clean_upsert_and_api_sample(wb):
     ws_upsert = wb["Upsert API Field Attribute"]
     ws_api_entity = wb["API Entity"]
 
@@ -169,42 +160,24 @@ def clean_upsert_and_api_sample():
     upsert_headers_lower = [str(h).lower() if h else "" for h in upsert_headers]
     entity_idx = upsert_headers_lower.index("entity")
     field_idx = upsert_headers_lower.index("field")
-    upsertable_idx = upsert_headers_lower.index("upsertable")
-    sample_value_idx = upsert_headers_lower.index("sample value")  # Add this line
 
-    # Collect rows to delete and keys to remove
-    rows_to_delete = []
+    # Evaluate the rules over the whole sheet, collect the keys to remove, and write the kept rows back in one pass
+    rules = compile_rules(load_rules(RULES_FILE))
+    rows = list(ws_upsert.iter_rows(min_row=2, values_only=True))
+    kept_rows = []
+    removed = []
     keys_to_remove = {}  # {entity: set(fields)}
 
-    for i, row in enumerate(ws_upsert.iter_rows(min_row=2), start=2):
-        entity = str(row[entity_idx].value) if row[entity_idx].value else ""
-        field = str(row[field_idx].value) if row[field_idx].value else ""
-        upsertable = str(row[upsertable_idx].value) if row[upsertable_idx].value else ""
-        sample_value = str(row[sample_value_idx].value) if row[sample_value_idx].value else ""
-        # Updated Criteria
-        if (not upsertable or upsertable.strip() == "false") and field != "__metadata":
-            rows_to_delete.append(i)
-            keys_to_remove.setdefault(entity, set()).add(field)
-            continue
-        # Criteria 2
-        if field.lower() == "operation":
-            rows_to_delete.append(i)
-            keys_to_remove.setdefault(entity, set()).add(field)
-            continue
-        # Criteria 3
-        if entity == "User" and field not in ["userId", "status", "username", "firstName", "lastName", "__metadata"]:
-            rows_to_delete.append(i)
-            keys_to_remove.setdefault(entity, set()).add(field)
-            continue
-        # Criteria 4: Blank sample value for PaymentInformationDetailV3
-        if entity == "PaymentInformationDetailV3" and sample_value == "":
-            rows_to_delete.append(i)
-            keys_to_remove.setdefault(entity, set()).add(field)
+    for row, rule in zip(rows, removal_reasons(rules, upsert_headers, rows)):
+        if rule is None:
+            kept_rows.append(row)
             continue
+        entity = str(row[entity_idx]) if row[entity_idx] else ""
+        field = str(row[field_idx]) if row[field_idx] else ""
+        keys_to_remove.setdefault(entity, set()).add(field)
+        removed.append([entity, field, rule])
 
-    # Remove rows in reverse order to avoid index shifting
-    for i in sorted(rows_to_delete, reverse=True):
-        ws_upsert.delete_rows(i)
+    rewrite_rows(ws_upsert, kept_rows, min_row=2)
 
     # Update API Sample Upsert JSON in API Entity sheet
     api_headers = [cell.value for cell in ws_api_entity[1]]
@@ -235,13 +208,31 @@ def clean_upsert_and_api_sample():
             # Write back as JSON string (with ensure_ascii=False for non-ASCII)
             row[api_sample_idx].value = json.dumps(data, ensure_ascii=False)
 
-    wb.save(UPSET_FILE)
+    report = pd.DataFrame(removed, columns=["Entity", "Field", "Rule"])
+    report.to_csv(REMOVED_REPORT, index=False, encoding="utf-8-sig")
+    counts = report["Rule"].value_counts()
+    for rule, _ in rules:
+        if rule in counts:
+            print(f"{counts[rule]} fields removed by rule '{rule}'")
+    print(f"Removed fields and their rules written to '{REMOVED_REPORT}'")
     print("Redundant rows and keys removed, and API Sample Upsert updated.")
 
 def main():
-    enrich_upsert_sheet_with_dictionary()
-    enrich_api_entity_sheet()
-    clean_upsert_and_api_sample()
+    # The workbook is loaded once (from the pipeline store when it is current) and passes through all three
+    # steps in memory; only the two outputs are written
+    wb = workbook_from_store(PIPELINE_STORE, UPSET_FILE, ["API Entity", "Upsert API Field Attribute"], ["Field Profile"])
+    if wb is None:
+        wb = openpyxl.load_workbook(UPSET_FILE)
+    enrich_upsert_sheet_with_dictionary(wb)
+    wb.save(UPSET_FILE)
+    enrich_api_entity_sheet(wb)
+    clean_upsert_and_api_sample(wb)
+    wb.save(NEW_FILE)
+    # Script 4 reads the final document from the pipeline store
+    for ws in (wb["API Entity"], wb["Upsert API Field Attribute"]):
+        rows = list(ws.iter_rows(values_only=True))
+        write_sheet(PIPELINE_STORE, NEW_FILE, ws.title, rows[0] if rows else [], rows[1:])
+    print(f"Merged document exported to {NEW_FILE}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
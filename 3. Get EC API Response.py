@@ -1,11 +1,17 @@
-import requests
-from requests.auth import HTTPBasicAuth
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import openpyxl
-from openpyxl.styles import PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 import os
 import re
 import json
+from sf_store import write_sheet, load_sheet
+from sf_entities import resolve_entity_sets, Progress
+from sf_http import build_session, HostRateLimiter, send, send_batch
+from sf_replay import use_http_mode
+from sf_json import ResultStream, truncate
+from sf_profile import EntityProfile, PROFILE_HEADERS
+from sf_metadata import index_service_metadata
+from sf_metadata_cache import MetadataCache, fetch_service_metadata
+from sf_style import autofit_and_style
 
 API_SERVER = "apiDemo.successfactors.com"
 USERNAME = "Berg@CompanyId"
@@ -18,8 +24,39 @@ ENTITY_SETS = [
     "PaymentInformationDetailV3", "Background_OutsideWorkExperience", "Background_Education",
     "Background_Certificates", "Background_Languages"
 ]
+DISCOVER_ENTITIES = False  # True: read all entity sets from the service document instead of ENTITY_SETS (same switch as script 1)
+ENTITY_INCLUDE = ["*"]  # With DISCOVER_ENTITIES, wildcard patterns of entity sets to query, e.g. ["Emp*", "Per*", "cust_*"]
+ENTITY_EXCLUDE = []  # With DISCOVER_ENTITIES, wildcard patterns of entity sets to leave out
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 EXCEL_FILE = os.path.join(SCRIPT_DIR, "SF New Hire API UpsertV1.xlsx")
+PIPELINE_STORE = os.path.join(SCRIPT_DIR, "SF_API_Pipeline.sqlite")  # Tables handed to the next scripts instead of the workbook
+MAX_WORKERS = 8  # Entities queried concurrently over one pooled session (1 = sequential)
+REQUESTS_PER_SECOND = 10  # Upper bound on requests sent to API_SERVER, shared by all workers (0 = unlimited)
+MAX_RETRIES = 5  # Retries of a request answered with 429/503, waiting Retry-After or a jittered exponential backoff
+REQUEST_TIMEOUT = 120  # Seconds per request
+SAMPLE_TRANSPORT = "get"  # "get": one request per query; "batch": pack the queries into multipart /odata/v2/$batch requests; "expand": see EXPAND_ROOTS
+BATCH_SIZE = 20  # Queries per $batch request
+EXPAND_ROOTS = ["User", "PerPerson"]  # With SAMPLE_TRANSPORT = "expand", entities whose navigation properties reach the others
+EXPAND_DEPTH = 3  # Navigation steps followed from a root entity
+# The service-wide $metadata read for "expand" shares the disk cache of 'EC Odata API Dictionary Extract.py'
+# (same folder and settings; entries are per API_SERVER and USERNAME)
+USE_METADATA_CACHE = True
+METADATA_CACHE_DIR = os.path.join(SCRIPT_DIR, ".metadata_cache")
+METADATA_CACHE_TTL = 24 * 3600
+METADATA_CACHE_MAX_BYTES = 512 * 1024 * 1024
+SERVICE_METADATA_MAX_BYTES = 256 * 1024 * 1024  # Larger service documents are not read; "expand" then falls back to "get"
+LOG_LIMIT = 2000  # Characters of each response body printed to the console
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes read at a time while looking for the first record of a response
+DRAIN_LIMIT = 256 * 1024  # Bodies up to this size are read to the end after the first record, so their connection goes back to the pool
+HTTP_MODE = "live"  # "live", "record" (save every exchange), "replay" (offline from CASSETTE_DIR) or "mock" (see sf_replay.py)
+CASSETTE_DIR = os.path.join(SCRIPT_DIR, "http_cassettes")
+MOCK_SERVER = "127.0.0.1:8765"  # Address of sf_mock_server.py for HTTP_MODE = "mock"
+QUERY_FROM_METADATA = True  # Build $filter/$select from the key and upsertable fields of script 1's dictionary
+DICT_FILE = os.path.join(SCRIPT_DIR, "EC_APIField_Metadata.xlsx")
+EMPLOYEE_KEYS = ["userId", "personIdExternal", "worker", "PaymentInformationV3_worker", "usersSysId"]  # Fields holding EmployeeId, by preference
+PRIMARY_ENTITIES = ["PerNationalId", "PerEmail", "PerPhone"]  # Entities queried with "and isPrimary eq true"
+PROFILE_RECORDS = 0  # Records per entity streamed page by page (__next) into the "Field Profile" sheet (0 = no profiling)
+PROFILE_TOP_VALUES = 3  # Most common values listed per field in "Field Profile"
 
 def get_filter(entity):
     if entity.startswith("Emp"):
@@ -39,100 +76,421 @@ def get_filter(entity):
     else:
         return "userId"
 
+def load_query_fields():
+    # {entity: {"filter", "primary", "select"}} from the "EC Data API Dictionary" written by script 1. The filter
+    # is a key property holding the employee (None: no such field, query $top=1 directly), "primary" whether the
+    # entity is one of PRIMARY_ENTITIES and has an isPrimary flag, and "select" its key and upsertable properties,
+    # navigation properties left out.
+    try:
+        headers, rows = load_sheet(PIPELINE_STORE, DICT_FILE, "EC Data API Dictionary")
+    except (OSError, KeyError) as e:
+        print(f"Field metadata unavailable ({e}), guessing filters from entity names")
+        return {}
+    col = {name: headers.index(name) if name in headers else None
+           for name in ("Entity", "Name", "Key", "upsertable", "NavigationField")}
+    missing = [name for name in ("Entity", "Name", "Key", "NavigationField") if col[name] is None]
+    if missing:
+        print(f"Field metadata unavailable (columns {missing} missing), guessing filters from entity names")
+        return {}
+    properties = {}
+    for row in rows:
+        if row[col["NavigationField"]] == "true":
+            continue
+        upsertable = row[col["upsertable"]] if col["upsertable"] is not None else ""
+        properties.setdefault(row[col["Entity"]], {})[row[col["Name"]]] = (row[col["Key"]] == "true", upsertable)
+    query_fields = {}
+    for entity, props in properties.items():
+        keys = [name for name, (is_key, upsertable) in props.items() if is_key]
+        filter_field = next((name for name in EMPLOYEE_KEYS if name in keys), None)
+        if filter_field is None:
+            filter_field = next((name for name in EMPLOYEE_KEYS + [get_filter(entity)] if name in props), None)
+        query_fields[entity] = {
+            "filter": filter_field,
+            "primary": entity in PRIMARY_ENTITIES and "isPrimary" in props,
+            # Fields script 2 drops anyway (upsertable "false" or missing) are not requested at all
+            "select": [name for name, (is_key, upsertable) in props.items() if is_key or upsertable not in ("false", "", None)],
+        }
+    return query_fields
+
 def clean_metadata_url(url):
     # Remove content between ( and )
     return re.sub(r"\(.*?\)", "", url)
 
 def clean_json(data):
-    if isinstance(data, dict):
-        cleaned = {}
-        for k, v in data.items():
-            # Remove keys as specified
-            if k.startswith("created") or k.startswith("lastModified") or "Nav" in k:
-                continue
-            # Skip key-value if value is a dict, except for __metadata
-            if isinstance(v, dict) and k != "__metadata":
-                continue
-            # Clean __metadata.url and __metadata.uri recursively
-            if k == "__metadata" and isinstance(v, dict):
-                if "url" in v:
-                    v["url"] = clean_metadata_url(v["url"])
-                if "uri" in v:
-                    v["uri"] = clean_metadata_url(v["uri"])
-            cleaned[k] = clean_json(v)
-        return cleaned
-    elif isinstance(data, list):
-        return [clean_json(item) for item in data]
-    elif data is None:
-        return ""
+    # Walks the payload with an explicit stack of the containers still to copy, so deep payloads cannot hit the
+    # recursion limit and scalars are copied in place without any per-node bookkeeping
+    if not isinstance(data, (dict, list)):
+        return "" if data is None else data
+    root = [None]
+    stack = [(data, root, 0)]
+    while stack:
+        value, target, slot = stack.pop()
+        if isinstance(value, dict):
+            cleaned = {}
+            for k, v in value.items():
+                # Remove keys as specified
+                if k.startswith("created") or k.startswith("lastModified") or "Nav" in k:
+                    continue
+                # Skip key-value if value is a dict, except for __metadata
+                if isinstance(v, dict) and k != "__metadata":
+                    continue
+                # Clean __metadata.url and __metadata.uri
+                if k == "__metadata" and isinstance(v, dict):
+                    if "url" in v:
+                        v["url"] = clean_metadata_url(v["url"])
+                    if "uri" in v:
+                        v["uri"] = clean_metadata_url(v["uri"])
+                if isinstance(v, (dict, list)):
+                    cleaned[k] = None  # Placeholder keeps the key order, filled when v is popped
+                    stack.append((v, cleaned, k))
+                else:
+                    cleaned[k] = "" if v is None else v
+        else:
+            cleaned = []
+            for i, item in enumerate(value):
+                if isinstance(item, (dict, list)):
+                    cleaned.append(None)
+                    stack.append((item, cleaned, i))
+                else:
+                    cleaned.append("" if item is None else item)
+        target[slot] = cleaned
+    return root[0]
+
+def fetch_first_result(session, limiter, entity, endpoint, label):
+    # Streams the response and stops parsing after its first record; the log shows at most LOG_LIMIT characters.
+    # The rest of a small body is still read so the pooled connection is reused; closing a larger one half-read
+    # drops its connection, which costs a new handshake but less than downloading the whole result set.
+    resp = send(session, "GET", endpoint, limiter, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT, stream=True)
+    with resp:
+        if resp.status_code >= 400:
+            print(f"{label} for {entity}: {truncate(resp.text, LOG_LIMIT)}")
+            resp.raise_for_status()
+        resp.encoding = resp.encoding or "utf-8"
+        stream = ResultStream(resp.iter_content(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True), LOG_LIMIT)
+        try:
+            first = next(iter(stream), None)
+            stream.drain(DRAIN_LIMIT)
+        finally:
+            print(f"{label} for {entity}: {stream.preview}")
+    return [first] if first is not None else []
+
+def select_option(fields):
+    return f"&$select={','.join(fields['select'])}" if fields and fields["select"] else ""
+
+def sample_endpoint(entity, fields=None):
+    # Filtered on the employee; fields (see load_query_fields) replace the name-based guess when available
+    if fields is None:
+        filter_field = get_filter(entity)
+        primary = entity in PRIMARY_ENTITIES
+    elif fields["filter"] is None:
+        return fallback_endpoint(entity, fields)
+    else:
+        filter_field = fields["filter"]
+        primary = fields["primary"]
+    if primary:
+        return f"https://{API_SERVER}/odata/v2/{entity}?$format=json&$filter={filter_field} eq '{EmployeeId}' and isPrimary eq true{select_option(fields)}"
+    return f"https://{API_SERVER}/odata/v2/{entity}?$format=json&$filter={filter_field} eq '{EmployeeId}'{select_option(fields)}"
+
+def fallback_endpoint(entity, fields=None):
+    return f"https://{API_SERVER}/odata/v2/{entity}?$format=json&$top=1{select_option(fields)}"
+
+def is_blank(result):
+    return (isinstance(result, list) and not result) or (isinstance(result, dict) and not result)
+
+def sample_rows(entity, endpoint, result):
+    # One entity's "API Entity" row and "Upsert API Field Attribute" rows from its query result
+    if isinstance(result, list):
+        result = result[0] if result else {}
+    elif isinstance(result, dict):
+        result = result
     else:
-        return data
-
-def autofit_and_style(ws):
-    green_fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
-    thin = Side(border_style="thin", color="000000")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-    # Autofit columns
-    for col in ws.columns:
-        max_length = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
+        result = {}
+    if "__metadata" in result and "url" in result["__metadata"]:
+        result["__metadata"]["url"] = clean_metadata_url(result["__metadata"]["url"])
+    cleaned = clean_json(result)
+    # Sheet 2
+    field_rows = []
+    for k, v in cleaned.items():
+        if isinstance(v, (dict, list)):
+            v = str(v)
+        field_rows.append([entity, k, v])
+    # Sheet 1
+    return [entity, endpoint, json.dumps(cleaned, ensure_ascii=False)], field_rows
+
+def collect_sample(session, limiter, entity, fields=None):
+    endpoint = sample_endpoint(entity, fields)
+    try:
+        result = fetch_first_result(session, limiter, entity, endpoint, "Response")
+        # If result is blank, try again without filter
+        if is_blank(result) and endpoint != fallback_endpoint(entity, fields):
+            endpoint = fallback_endpoint(entity, fields)
+            result = fetch_first_result(session, limiter, entity, endpoint, "Fallback response")
+        return sample_rows(entity, endpoint, result)
+    except Exception as e:
+        return [entity, endpoint, f"Error: {e}"], None
+
+def batch_responses(session, limiter, endpoints, label):
+    # {entity: endpoint} -> {entity: (status, reason, body) or the exception that failed its $batch request}.
+    # BATCH_SIZE queries share one $batch round-trip; up to MAX_WORKERS batches are in flight at once.
+    service_root = f"https://{API_SERVER}/odata/v2/"
+    entities = list(endpoints)
+    chunks = [entities[i:i + BATCH_SIZE] for i in range(0, len(entities), max(1, BATCH_SIZE))]
+    responses = {}
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        futures = {
+            pool.submit(send_batch, session, service_root, [endpoints[entity][len(service_root):] for entity in chunk],
+                        limiter, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT): chunk
+            for chunk in chunks
+        }
+        progress = Progress(label, len(entities))
+        for future in as_completed(futures):
+            chunk = futures[future]
             try:
-                if cell.value:
-                    max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        ws.column_dimensions[col_letter].width = max_length + 2
-    # Autofit rows
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.border = border
-    # Green header
-    for cell in ws[1]:
-        cell.fill = green_fill
+                responses.update(zip(chunk, future.result()))
+            except Exception as e:
+                responses.update((entity, e) for entity in chunk)
+            for entity in chunk:
+                progress.update(failed=isinstance(responses[entity], Exception))
+    return responses
 
-def main():
-    api_entity_rows = []
-    field_attr_rows = []
-    for entity in ENTITY_SETS:
-        filter_field = get_filter(entity)
-        if entity in ["PerNationalId", "PerEmail", "PerPhone"]:
-            endpoint = f"https://{API_SERVER}/odata/v2/{entity}?$format=json&$filter={filter_field} eq '{EmployeeId}' and isPrimary eq true"
-        else:
-            endpoint = f"https://{API_SERVER}/odata/v2/{entity}?$format=json&$filter={filter_field} eq '{EmployeeId}'"
+def batch_result(entity, endpoint, response, label):
+    # Same checks as the GET path: print the body, fail on HTTP errors, parse the JSON
+    if isinstance(response, Exception):
+        raise response
+    status, reason, text = response
+    print(f"{label} for {entity}: {truncate(text, LOG_LIMIT)}")
+    if status >= 400:
+        raise RuntimeError(f"{status} {reason} for url: {endpoint}")
+    first = next(iter(ResultStream([text])), None)
+    return [first] if first is not None else []
+
+def collect_samples_batched(session, limiter, entity_sets, query_fields):
+    # The filtered queries of all entities in $batch requests, then one more round for the $top=1 fallbacks
+    endpoints = {entity: sample_endpoint(entity, query_fields.get(entity)) for entity in entity_sets}
+    results = {}
+    errors = {}
+    responses = batch_responses(session, limiter, endpoints, "Samples")
+    for entity in entity_sets:
         try:
-            resp = requests.get(endpoint, auth=HTTPBasicAuth(USERNAME, PASSWORD), verify=True)
-            print(f"Response for {entity}: {resp.text}")
-            resp.raise_for_status()
-            d = resp.json()
-            result = d.get('d', {}).get('results') or d.get('d', {}).get('result', [])
-            # If result is blank, try again without filter
-            if (isinstance(result, list) and not result) or (isinstance(result, dict) and not result):
-                endpoint = f"https://{API_SERVER}/odata/v2/{entity}?$format=json&$top=1"
-                resp = requests.get(endpoint, auth=HTTPBasicAuth(USERNAME, PASSWORD), verify=True)
-                print(f"Fallback response for {entity}: {resp.text}")
-                resp.raise_for_status()
-                d = resp.json()
-                result = d.get('d', {}).get('results') or d.get('d', {}).get('result', [])
-            if isinstance(result, list):
-                result = result[0] if result else {}
-            elif isinstance(result, dict):
-                result = result
-            else:
-                result = {}
-            if "__metadata" in result and "url" in result["__metadata"]:
-                result["__metadata"]["url"] = clean_metadata_url(result["__metadata"]["url"])
-            cleaned = clean_json(result)
-            # Sheet 1
-            api_entity_rows.append([entity, endpoint, json.dumps(cleaned, ensure_ascii=False)])
-            # Sheet 2
-            for k, v in cleaned.items():
-                if isinstance(v, (dict, list)):
-                    v = str(v)
-                field_attr_rows.append([entity, k, v])
+            results[entity] = batch_result(entity, endpoints[entity], responses[entity], "Response")
+        except Exception as e:
+            errors[entity] = e
+    fallbacks = {
+        entity: fallback_endpoint(entity, query_fields.get(entity)) for entity in entity_sets
+        if entity in results and is_blank(results[entity]) and endpoints[entity] != fallback_endpoint(entity, query_fields.get(entity))
+    }
+    endpoints.update(fallbacks)
+    if fallbacks:
+        responses = batch_responses(session, limiter, fallbacks, "Fallback samples")
+        for entity in fallbacks:
+            try:
+                results[entity] = batch_result(entity, endpoints[entity], responses[entity], "Fallback response")
+            except Exception as e:
+                errors[entity] = e
+    samples = {}
+    for entity in entity_sets:
+        try:
+            if entity in errors:
+                raise errors[entity]
+            samples[entity] = sample_rows(entity, endpoints[entity], results[entity])
         except Exception as e:
-            api_entity_rows.append([entity, endpoint, f"Error: {e}"])
+            samples[entity] = [entity, endpoints[entity], f"Error: {e}"], None
+    return samples
+
+def profile_endpoint(entity, fields=None):
+    # Records of all employees; the server pages through them with __next/$skiptoken
+    return f"https://{API_SERVER}/odata/v2/{entity}?$format=json&$top={PROFILE_RECORDS}{select_option(fields)}"
+
+def profile_entity(session, limiter, entity, fields=None):
+    # Streams up to PROFILE_RECORDS records into per-field statistics, one record in memory at a time
+    profile = EntityProfile()
+    url = profile_endpoint(entity, fields)
+    pages = 0
+    while url and profile.records < PROFILE_RECORDS:
+        resp = send(session, "GET", url, limiter, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT, stream=True)
+        with resp:
+            if resp.status_code >= 400:
+                print(f"Profile response for {entity}: {truncate(resp.text, LOG_LIMIT)}")
+                resp.raise_for_status()
+            resp.encoding = resp.encoding or "utf-8"
+            stream = ResultStream(resp.iter_content(chunk_size=STREAM_CHUNK_SIZE, decode_unicode=True), LOG_LIMIT)
+            for record in stream:
+                record = clean_json(record)
+                record.pop("__metadata", None)
+                profile.add(record)
+                if profile.records >= PROFILE_RECORDS:
+                    break
+            url = stream.next_link
+        pages += 1
+    print(f"Profile for {entity}: {profile.records} records in {pages} pages")
+    return profile.rows(entity, PROFILE_TOP_VALUES)
+
+def profile_entities(session, limiter, entity_sets, query_fields):
+    # {entity: "Field Profile" rows, None if profiling failed}, up to MAX_WORKERS entities at once
+    profiles = {}
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        futures = {
+            pool.submit(profile_entity, session, limiter, entity, query_fields.get(entity)): entity for entity in entity_sets
+        }
+        progress = Progress("Profiles", len(futures))
+        for future in as_completed(futures):
+            entity = futures[future]
+            try:
+                profiles[entity] = future.result()
+            except Exception as e:
+                print(f"Profile for {entity} failed: {e}")
+                profiles[entity] = None
+            progress.update(failed=profiles[entity] is None)
+    return profiles
+
+def collect_samples(session, limiter, entities, query_fields, label="Samples"):
+    # One query (plus its fallback) per entity, up to MAX_WORKERS at once
+    samples = {}
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        futures = {
+            pool.submit(collect_sample, session, limiter, entity, query_fields.get(entity)): entity for entity in entities
+        }
+        progress = Progress(label, len(futures))
+        for future in as_completed(futures):
+            entity = futures[future]
+            samples[entity] = future.result()
+            progress.update(failed=samples[entity][1] is None)
+    return samples
+
+def load_navigation_graph(session, limiter):
+    # Entity sets and navigation properties of the service-wide $metadata. The document is kept in the metadata
+    # cache of 'EC Odata API Dictionary Extract.py' and revalidated with a conditional request, so an unchanged
+    # document is not downloaded again
+    cache = MetadataCache(METADATA_CACHE_DIR, API_SERVER, USERNAME, METADATA_CACHE_TTL, METADATA_CACHE_MAX_BYTES)
+    xml_path, temporary = fetch_service_metadata(
+        lambda url, headers: send(session, "GET", url, limiter, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT,
+                                  stream=True, headers=headers),
+        f"https://{API_SERVER}/odata/v2/$metadata", cache, SERVICE_METADATA_MAX_BYTES, USE_METADATA_CACHE
+    )
+    try:
+        with open(xml_path, "rb") as f:
+            return index_service_metadata(f)
+    finally:
+        if temporary:
+            os.remove(xml_path)
+
+def expand_paths(graph, root, entity_sets):
+    # {entity: $expand path} of the entity sets reachable from root within EXPAND_DEPTH navigation steps, each
+    # through its shortest path
+    set_of_type = {}
+    for entity_set, type_name in graph["entity_sets"].items():
+        set_of_type.setdefault(type_name, entity_set)
+    root_type = graph["entity_sets"].get(root, root)
+    wanted = set(entity_sets) - {root}
+    paths = {}
+    seen = {root_type}
+    level = [(root_type, "")]
+    for _ in range(EXPAND_DEPTH):
+        next_level = []
+        for type_name, prefix in level:
+            for nav, (target, many) in graph["navigations"].get(type_name, {}).items():
+                if target in seen:
+                    continue
+                seen.add(target)
+                if set_of_type.get(target) in wanted:
+                    paths[set_of_type[target]] = prefix + nav
+                next_level.append((target, f"{prefix}{nav}/"))
+        level = next_level
+    return paths
+
+def expand_endpoint(entity, fields, paths):
+    # The root's sample query with $expand; without $select, as nested $select paths would make the URL too long
+    fields = dict(fields, select=[]) if fields else None
+    return f"{sample_endpoint(entity, fields)}&$expand={','.join(paths)}"
+
+def expanded_record(record, path):
+    # The record at the end of a $expand path (the primary or first one of a collection), None if there is none
+    for name in path.split("/"):
+        value = record.get(name)
+        if isinstance(value, dict) and "results" in value:
+            items = [item for item in value["results"] if isinstance(item, dict)]
+            value = next((item for item in items if item.get("isPrimary") is True), items[0] if items else None)
+        if not isinstance(value, dict) or "__deferred" in value:
+            return None
+        record = value
+    return record
+
+def selected_fields(record, fields):
+    # The record as a query with the entity's $select (see load_query_fields) returns it
+    if not fields or not fields["select"]:
+        return record
+    select = set(fields["select"])
+    return {name: value for name, value in record.items() if name == "__metadata" or name in select}
+
+def fetch_expanded(session, limiter, root, paths, query_fields):
+    # {entity: sample rows} of the root and of every entity found in its expanded record. The query has no $select,
+    # so each record is cut down to the fields of the entity's own $select; the endpoint is the query sent.
+    endpoint = expand_endpoint(root, query_fields.get(root), paths.values())
+    result = fetch_first_result(session, limiter, root, endpoint, "Expanded response")
+    if not result:
+        return {}
+    nested = {entity: expanded_record(result[0], path) for entity, path in paths.items()}
+    samples = {root: sample_rows(root, endpoint, [selected_fields(result[0], query_fields.get(root))])}
+    for entity, record in nested.items():
+        if record:
+            samples[entity] = sample_rows(entity, endpoint, [selected_fields(record, query_fields.get(entity))])
+    return samples
+
+def collect_samples_expanded(session, limiter, entity_sets, query_fields):
+    # Each EXPAND_ROOTS entity is queried once with $expand of the entities it reaches that no earlier root
+    # covered, and the nested records become their samples. Entities out of reach, without a nested record or
+    # behind a failed expanded query are queried one by one as usual.
+    try:
+        graph = load_navigation_graph(session, limiter)
+    except Exception as e:
+        print(f"Navigation graph unavailable ({e}), querying every entity separately")
+        graph = {"entity_sets": {}, "navigations": {}}
+    plan = {}
+    covered = set()
+    for root in EXPAND_ROOTS:
+        if root not in entity_sets or root in covered:
             continue
+        paths = {entity: path for entity, path in expand_paths(graph, root, entity_sets).items() if entity not in covered}
+        covered.add(root)
+        covered.update(paths)
+        plan[root] = paths
+    samples = {}
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        futures = {pool.submit(fetch_expanded, session, limiter, root, paths, query_fields): root for root, paths in plan.items()}
+        progress = Progress("Expanded samples", len(futures))
+        for future in as_completed(futures):
+            root = futures[future]
+            try:
+                samples.update(future.result())
+            except Exception as e:
+                print(f"Expanded query of {root} failed ({e}), querying its entities separately")
+            progress.update(failed=root not in samples)
+    rest = [entity for entity in entity_sets if entity not in samples]
+    print(f"Samples of {len(samples)} entities from {len(plan)} expanded queries, {len(rest)} queried separately")
+    samples.update(collect_samples(session, limiter, rest, query_fields))
+    return samples
+
+def main():
+    api_entity_rows = []
+    field_attr_rows = []
+    session = use_http_mode(build_session(USERNAME, PASSWORD, MAX_WORKERS), HTTP_MODE, CASSETTE_DIR, MOCK_SERVER, MAX_WORKERS)
+    limiter = HostRateLimiter(REQUESTS_PER_SECOND)
+    entity_sets = resolve_entity_sets(session, API_SERVER, REQUEST_TIMEOUT, ENTITY_SETS, DISCOVER_ENTITIES, ENTITY_INCLUDE, ENTITY_EXCLUDE)
+    query_fields = load_query_fields() if QUERY_FROM_METADATA else {}
+    if SAMPLE_TRANSPORT == "batch":
+        samples = collect_samples_batched(session, limiter, entity_sets, query_fields)
+    elif SAMPLE_TRANSPORT == "expand":
+        samples = collect_samples_expanded(session, limiter, entity_sets, query_fields)
+    else:
+        samples = collect_samples(session, limiter, entity_sets, query_fields)
+    profiles = profile_entities(session, limiter, entity_sets, query_fields) if PROFILE_RECORDS > 0 else {}
+    session.close()
+    # Rows keep the entity order, as in a sequential run
+    for entity in entity_sets:
+        api_entity_row, field_rows = samples[entity]
+        api_entity_rows.append(api_entity_row)
+        field_attr_rows.extend(field_rows or [])
+    profile_rows = [row for entity in entity_sets for row in profiles.get(entity) or []]
 
     # Write to Excel
     wb = openpyxl.Workbook()
@@ -143,14 +501,25 @@ def main():
     ws1.append(["Entity", "API Endpoint", "API Sample Upsert"])
     for row in api_entity_rows:
         ws1.append(row)
-    autofit_and_style(ws1)
+    autofit_and_style(ws1, fill_empty_header=True)
 
     ws2.append(["Entity", "Field", "Sample Value"])
     for row in field_attr_rows:
         ws2.append(row)
-    autofit_and_style(ws2)
+    autofit_and_style(ws2, fill_empty_header=True)
+
+    if profiles:
+        ws3 = wb.create_sheet("Field Profile")
+        ws3.append(PROFILE_HEADERS)
+        for row in profile_rows:
+            ws3.append(row)
+        autofit_and_style(ws3, fill_empty_header=True)
 
     wb.save(EXCEL_FILE)
+    write_sheet(PIPELINE_STORE, EXCEL_FILE, "API Entity", ["Entity", "API Endpoint", "API Sample Upsert"], api_entity_rows)
+    write_sheet(PIPELINE_STORE, EXCEL_FILE, "Upsert API Field Attribute", ["Entity", "Field", "Sample Value"], field_attr_rows)
+    if profiles:
+        write_sheet(PIPELINE_STORE, EXCEL_FILE, "Field Profile", PROFILE_HEADERS, profile_rows)
     print(f"Done. Output: {os.path.abspath(EXCEL_FILE)}")
 
 if __name__ == "__main__":
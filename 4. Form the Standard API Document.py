@@ -1,8 +1,15 @@
 import openpyxl
-import json
+import csv
 import os
+import re
+import time
+from datetime import datetime, timezone
 from openpyxl.styles import Border, Side
-import requests
+from sf_store import load_sheet
+from sf_replay import use_http_mode
+from sf_http import build_session, HostRateLimiter, send
+from sf_payload import load_substitutions, compile_substitutions, compile_template, slot_values
+from sf_upsert import dependency_graph, dependency_levels, run_in_dependency_order, run_batched_upserts, upsert_succeeded
 
 EMPLOYEE_ID = "Berg01"
 POSITION = "10023800"
@@ -12,45 +19,72 @@ TEST_API_SERVER = "apiDemopreview.sapsf.com"
 API_ENDPOINT = f"https://{TEST_API_SERVER}/odata/v2/upsert?$format=json&$purgeType=full"
 RELATED_PERSONIDEXTERNAL = "Berg01_01"
 BACKGROUND_ID="0"
+USERNAME = "mdmapi@xiaojuscieT1"
+PASSWORD = "sfmdmapi123"
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_FILE = os.path.join(SCRIPT_DIR, "New Hire API DocumentV1.xlsx")
 OUTPUT_FILE = os.path.join(SCRIPT_DIR, "New Hire API Post Preview.xlsx")
+PIPELINE_STORE = os.path.join(SCRIPT_DIR, "SF_API_Pipeline.sqlite")
+HTTP_MODE = "live"  # "live", "record" (save every exchange), "replay" (offline from CASSETTE_DIR) or "mock" (see sf_replay.py)
+CASSETTE_DIR = os.path.join(SCRIPT_DIR, "http_cassettes")
+MOCK_SERVER = "127.0.0.1:8765"  # Address of sf_mock_server.py for HTTP_MODE = "mock"
+SUBSTITUTIONS_FILE = os.path.join(SCRIPT_DIR, "payload_substitutions.json")  # Values filled into the sample bodies, see sf_payload.py
+MAX_WORKERS = 4  # Upserts sent concurrently over one pooled session, among entities that do not depend on each other
+REQUESTS_PER_SECOND = 5  # Upper bound on upserts sent to TEST_API_SERVER, shared by all workers (0 = unlimited)
+MAX_RETRIES = 5  # Retries of an upsert answered with 429/503
+REQUEST_TIMEOUT = 30
+# Entity (or fnmatch pattern) -> entities whose upsert must succeed first; an exact name wins over the patterns.
+# The dependents of a failed upsert are skipped (see sf_upsert.py).
+UPSERT_DEPENDENCIES = {
+    "User": [],
+    "PerPerson": ["User"],
+    "EmpEmployment": ["PerPerson"],
+    "PaymentInformationDetailV3": ["PaymentInformationV3"],
+    "Emp*": ["EmpEmployment"],
+    "Per*": ["EmpEmployment"],
+    "Payment*": ["EmpEmployment"],
+    "Background_*": ["User"],
+}
+BULK_MODE = False  # True: upsert every hire of BULK_HIRES_FILE instead of the single EMPLOYEE_ID above
+BULK_HIRES_FILE = os.path.join(SCRIPT_DIR, "New Hire Bulk Upload.csv")  # One row per hire, columns named like the constants above
+BULK_RESULTS_FILE = os.path.join(SCRIPT_DIR, "New Hire Bulk Upsert Results.csv")
+BULK_BATCH_SIZE = 100  # Records per upsert call in bulk mode
 
 MAX_SHEETNAME_LEN = 31
 
-def transform_json(json_str, entity_name=None):
-    # Try to parse JSON (handle single/double quotes)
-    try:
-        data = json.loads(json_str)
-    except Exception:
-        data = json.loads(json_str.replace("'", '"'))
-    # Replace values as required
-    for key in list(data.keys()):
-        if key in ["userId", "personIdExternal", "username", "PaymentInformationV3_worker", "worker"]:
-            data[key] = EMPLOYEE_ID
-        elif key == "emailAddress":
-            data[key] = f"{EMPLOYEE_ID}@dummy.com"
-        elif key == "position":
-            data[key] = POSITION
-        elif key == "backgroundElementId":
-            data[key] = BACKGROUND_ID
-        elif key == "eventReason":
-            data[key] = EVENT_REASON
-        elif key == "relatedPersonIdExternal":
-            data[key] = RELATED_PERSONIDEXTERNAL
-        elif key in ["startDate", "PaymentInformationV3_effectiveStartDate", "effectiveStartDate", "payDate"]:
-            # Only replace if entity_name does NOT start with "Background"
-            if not (entity_name and str(entity_name).startswith("Background")):
-                data[key] = HIRE_DATE
-        elif key == "__metadata" and isinstance(data[key], dict):
-            if "uri" in data[key]:
-                data[key]["uri"] = data[key]["uri"].replace("apiDemo.successfactors.com", TEST_API_SERVER)
-    return data
-
-def remove_blank_values(d):
-    """Remove keys where value is None or blank string."""
-    return {k: v for k, v in d.items() if v not in [None, ""]}
+def hire_values(row=None):
+    # Values for the placeholders of SUBSTITUTIONS_FILE: the constants above, overridden by the non-blank columns of a
+    # BULK_HIRES_FILE row with the same names. A HIRE_DATE given as YYYY-MM-DD is converted to /Date(ms)/.
+    values = {
+        "EMPLOYEE_ID": EMPLOYEE_ID,
+        "POSITION": POSITION,
+        "EVENT_REASON": EVENT_REASON,
+        "HIRE_DATE": HIRE_DATE,
+        "RELATED_PERSONIDEXTERNAL": RELATED_PERSONIDEXTERNAL,
+        "BACKGROUND_ID": BACKGROUND_ID,
+        "TEST_API_SERVER": TEST_API_SERVER,
+    }
+    for name, value in (row or {}).items():
+        name = str(name).strip().upper()
+        if name in values and value is not None and str(value).strip():
+            values[name] = str(value).strip()
+    date = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})", values["HIRE_DATE"])
+    if date:
+        epoch = datetime(*map(int, date.groups()), tzinfo=timezone.utc).timestamp()
+        values["HIRE_DATE"] = f"/Date({int(epoch) * 1000})/"
+    return values
+
+def compile_templates(samples):
+    # [(entity, PayloadTemplate)] of the (entity, sample upsert) pairs; samples that cannot be parsed are reported and left out
+    rules = compile_substitutions(load_substitutions(SUBSTITUTIONS_FILE), hire_values())
+    templates = []
+    for entity, json_str in samples:
+        try:
+            templates.append((entity, compile_template(json_str, entity, rules)))
+        except Exception as e:
+            print(f"Error parsing JSON for entity {entity}: {e}")
+    return templates
 
 def get_valid_sheet_name(entity_name):
     sheet_name = str(entity_name)
@@ -139,9 +173,8 @@ def update_api_templates():
     print(f"API Template sheets updated and B–I copied for all entities in {INTEGRATION_FILE}")
 
 def main():
-    wb = openpyxl.load_workbook(INPUT_FILE)
-    ws = wb["API Entity"]
-    headers = [cell.value for cell in ws[1]]
+    # The document produced by script 2, from the pipeline store unless the workbook was edited afterwards
+    headers, api_entity_rows = load_sheet(PIPELINE_STORE, INPUT_FILE, "API Entity")
     api_sample_idx = headers.index("Api sample upsert")
     entity_idx = headers.index("Entity")
 
@@ -151,32 +184,13 @@ def main():
     out_ws.title = "API Post Preview"
     out_ws.append(["Entity", "API Endpoint", "Body", "Valid Body"])
 
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        entity = row[entity_idx]
-        json_str = row[api_sample_idx]
-        if not json_str:
-            continue
-        try:
-            body = transform_json(json_str, entity)
-            valid_body = remove_blank_values(body)
-            # Special handling for User entity __metadata.uri
-            if entity == "User" and "__metadata" in valid_body and isinstance(valid_body["__metadata"], dict):
-                uri = valid_body["__metadata"].get("uri", "")
-                # Only append if not already present
-                if not uri.endswith(f"('{EMPLOYEE_ID}')"):
-                    if uri.endswith("User"):
-                        uri += f"('{EMPLOYEE_ID}')"
-                        valid_body["__metadata"]["uri"] = uri
-        except Exception as e:
-            print(f"Error parsing JSON for entity {entity}: {e}")
-            continue
-        out_ws.append([
-            entity,
-            API_ENDPOINT,
-            json.dumps(body, ensure_ascii=False),
-            json.dumps(valid_body, ensure_ascii=False)
-        ])
-        print(f"Entity: {entity}\nEndpoint: {API_ENDPOINT}\nBody: {json.dumps(body, ensure_ascii=False)}\nValid Body: {json.dumps(valid_body, ensure_ascii=False)}\n")
+    values = slot_values(hire_values())
+    samples = [(row[entity_idx], row[api_sample_idx]) for row in api_entity_rows if row[api_sample_idx]]
+    for entity, template in compile_templates(samples):
+        body = template.render(values)
+        valid_body = template.render_valid(values)
+        out_ws.append([entity, API_ENDPOINT, body, valid_body])
+        print(f"Entity: {entity}\nEndpoint: {API_ENDPOINT}\nBody: {body}\nValid Body: {valid_body}\n")
 
     out_wb.save(OUTPUT_FILE)
     print(f"Preview exported to {OUTPUT_FILE}")
@@ -209,14 +223,13 @@ def main():
             integration_ws.cell(row=row[0].row, column=sample_upsert_idx + 1, value=entity_to_valid_body[entity])
 
     # Copy and transform "Upsert API Field Attribute" to "SF Master Data Dictionary"
-    upsert_ws = wb["Upsert API Field Attribute"]
+    upsert_headers, upsert_rows = load_sheet(PIPELINE_STORE, INPUT_FILE, "Upsert API Field Attribute")
     sf_master_ws = integration_wb["SF Master Data Dictionary"]
 
     # Clear existing data except header in SF Master Data Dictionary
     sf_master_ws.delete_rows(2, sf_master_ws.max_row - 1)
 
     # Get headers and indices
-    upsert_headers = [cell.value for cell in upsert_ws[1]]
     field_idx = upsert_headers.index("Field")
     sample_value_idx = upsert_headers.index("Sample value")
 
@@ -224,7 +237,7 @@ def main():
     if all(cell.value is None for cell in sf_master_ws[1]):
         sf_master_ws.append(upsert_headers)
 
-    for row in upsert_ws.iter_rows(min_row=2, values_only=True):
+    for row in upsert_rows:
         row = list(row)
         field = str(row[field_idx]) if row[field_idx] else ""
         sample_value = row[sample_value_idx]
@@ -268,6 +281,12 @@ def post_valid_bodies_and_export_response():
     sample_upsert_idx = integration_headers.index("Sample Upsert")
     sample_response_idx = integration_headers.index("Sample Response")
 
+    # First row of every entity in SF Master Table List
+    integration_rows = {}
+    for int_row in integration_ws.iter_rows(min_row=2):
+        integration_rows.setdefault(str(int_row[entity_idx_integration].value), int_row[0].row)
+
+    tasks = []
     for i, row in enumerate(preview_ws.iter_rows(min_row=2), start=2):
         valid_body = row[valid_body_idx].value
         entity = row[0].value
@@ -275,35 +294,90 @@ def post_valid_bodies_and_export_response():
             preview_ws.cell(row=i, column=response_col, value="Skipped: Blank body")
             print(f"Row {i}: Skipped (blank body)")
             continue
+        tasks.append((str(entity), (i, entity, valid_body)))
+    graph = dependency_graph([entity for entity, _ in tasks], UPSERT_DEPENDENCIES)
+    print("Upsert order: " + " -> ".join(", ".join(level) for level in dependency_levels(graph)))
+
+    session = use_http_mode(build_session(USERNAME, PASSWORD, MAX_WORKERS), HTTP_MODE, CASSETTE_DIR, MOCK_SERVER, MAX_WORKERS)
+    limiter = HostRateLimiter(REQUESTS_PER_SECOND)
+
+    def post(task):
+        i, entity, valid_body = task
         try:
-            response = requests.post(
-                API_ENDPOINT,
-                data=valid_body.encode("utf-8"),
-                headers={"Content-Type": "application/json"},
-                auth=("mdmapi@xiaojuscieT1", "sfmdmapi123"),
-                timeout=30
-            )
-            api_response = response.text
-            preview_ws.cell(row=i, column=response_col, value=api_response)
-            print(f"Row {i}: Response: {response.status_code} {api_response}")
+            response = send(session, "POST", API_ENDPOINT, limiter, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT,
+                            data=valid_body.encode("utf-8"), headers={"Content-Type": "application/json"})
         except Exception as e:
-            api_response = f"Error: {e}"
-            preview_ws.cell(row=i, column=response_col, value=api_response)
             print(f"Row {i}: Error: {e}")
+            return False, f"Error: {e}"
+        print(f"Row {i}: Response: {response.status_code} {response.text}")
+        return upsert_succeeded(response), response.text
+
+    for (i, entity, valid_body), ok, api_response in run_in_dependency_order(tasks, graph, post, MAX_WORKERS):
+        if ok is None:
+            print(f"Row {i}: {api_response}")
+        preview_ws.cell(row=i, column=response_col, value=api_response)
 
         # --- Copy Valid Body and API Response to SF Master Table List ---
-        for int_row in integration_ws.iter_rows(min_row=2):
-            if str(int_row[entity_idx_integration].value) == str(entity):
-                integration_ws.cell(row=int_row[0].row, column=sample_upsert_idx + 1, value=valid_body)
-                integration_ws.cell(row=int_row[0].row, column=sample_response_idx + 1, value=api_response)
-                break
+        if str(entity) in integration_rows:
+            integration_ws.cell(row=integration_rows[str(entity)], column=sample_upsert_idx + 1, value=valid_body)
+            integration_ws.cell(row=integration_rows[str(entity)], column=sample_response_idx + 1, value=api_response)
 
+    session.close()
     preview_wb.save(OUTPUT_FILE)
     integration_wb.save(INTEGRATION_FILE)
     print(f"API responses exported to {OUTPUT_FILE} and copied to SF Master Table List")
 
+def bulk_upsert():
+    """Upserts the sample bodies of 'API Entity' for every hire of BULK_HIRES_FILE, BULK_BATCH_SIZE records per call.
+
+    The entities are sent in UPSERT_DEPENDENCIES order; a hire whose parent record failed is not sent further,
+    the other hires go on. Each record's result is written to BULK_RESULTS_FILE.
+    """
+    headers, api_entity_rows = load_sheet(PIPELINE_STORE, INPUT_FILE, "API Entity")
+    api_sample_idx = headers.index("Api sample upsert")
+    entity_idx = headers.index("Entity")
+    samples = [(row[entity_idx], row[api_sample_idx]) for row in api_entity_rows if row[api_sample_idx]]
+    with open(BULK_HIRES_FILE, newline="", encoding="utf-8-sig") as f:
+        hires = [hire_values(row) for row in csv.DictReader(f)]
+
+    hire_slots = [slot_values(hire) for hire in hires]
+    records = [
+        (n, str(entity), template.render_valid(values))
+        for entity, template in compile_templates(samples) for n, values in enumerate(hire_slots)
+    ]
+    graph = dependency_graph(list(dict.fromkeys(entity for _, entity, _ in records)), UPSERT_DEPENDENCIES)
+    print(f"Bulk upsert of {len(hires)} hires, {len(records)} records: "
+          + " -> ".join(", ".join(level) for level in dependency_levels(graph)))
+
+    session = use_http_mode(build_session(USERNAME, PASSWORD, MAX_WORKERS), HTTP_MODE, CASSETTE_DIR, MOCK_SERVER, MAX_WORKERS)
+    limiter = HostRateLimiter(REQUESTS_PER_SECOND)
+    calls = []
+
+    def post(bodies):
+        calls.append(len(bodies))
+        return send(session, "POST", API_ENDPOINT, limiter, max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT,
+                    data=("[" + ", ".join(bodies) + "]").encode("utf-8"),
+                    headers={"Content-Type": "application/json"})
+
+    started = time.perf_counter()
+    counts = {"OK": 0, "ERROR": 0, "SKIPPED": 0}
+    with open(BULK_RESULTS_FILE, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Row", "EMPLOYEE_ID", "Entity", "Status", "Message"])
+        for n, entity, ok, message in run_batched_upserts(records, graph, post, BULK_BATCH_SIZE, MAX_WORKERS):
+            status = "SKIPPED" if ok is None else "OK" if ok else "ERROR"
+            counts[status] += 1
+            writer.writerow([n + 2, hires[n]["EMPLOYEE_ID"], entity, status, message])
+    session.close()
+    print(f"Bulk upsert finished in {time.perf_counter() - started:.1f}s with {len(calls)} calls: "
+          f"{counts['OK']} records upserted, {counts['ERROR']} failed, {counts['SKIPPED']} skipped")
+    print(f"Per-record results written to {BULK_RESULTS_FILE}")
+
 # Call this at the end of your main()
 if __name__ == "__main__":
-    main()
-    post_valid_bodies_and_export_response()
-    update_api_templates()
\ No newline at end of file
+    if BULK_MODE:
+        bulk_upsert()
+    else:
+        main()
+        post_valid_bodies_and_export_response()
+        update_api_templates()
\ No newline at end of file
@@ -0,0 +1,115 @@
+import random
+import time
+import xml.etree.ElementTree as ET
+import pandas as pd
+from sf_metadata import ns, get_attr_value, clean_attr, tree_records, extract_dictionary
+
+# Offline benchmark: former three-walk dictionary extraction vs. the deduplicating single-pass extract_dictionary().
+# Synthetic $metadata documents stand in for a wide tenant; no SuccessFactors connection is needed.
+DOCUMENTS = 200
+TYPES_PER_DOCUMENT = 3
+PROPERTIES_PER_TYPE = 120
+ROUNDS = 3
+
+SAP_ATTRS = ["required", "creatable", "updatable", "upsertable", "visible", "sortable", "filterable",
+             "label", "picklist", "field-control", "display-format", "elm-pii"]
+
+def synthetic_document(doc_no, rng):
+    types = []
+    for t in range(TYPES_PER_DOCUMENT):
+        # Related types are shared between documents with identical content, as navigation targets are in real tenants
+        type_name = f"Entity{doc_no}" if t == 0 else f"Shared{rng.randint(0, 20)}"
+        type_rng = rng if t == 0 else random.Random(type_name)
+        props = []
+        for p in range(PROPERTIES_PER_TYPE):
+            attrs = [f'Name="f{p}"', 'Type="Edm.String"', f'MaxLength="{type_rng.randint(1, 255)}"']
+            attrs += [f'sap:{a}="v{type_rng.randint(0, 3)}"' for a in type_rng.sample(SAP_ATTRS, type_rng.randint(4, len(SAP_ATTRS)))]
+            props.append(f'<Property {" ".join(attrs)}/>')
+        props.append(f'<NavigationProperty Name="{type_name}Nav" Relationship="SFOData.r_{type_name}" FromRole="a" ToRole="b" sap:label="Nav"/>')
+        types.append(f'<EntityType Name="{type_name}"><Key><PropertyRef Name="f0"/></Key>{"".join(props)}</EntityType>')
+    xml = (
+        '<edmx:Edmx Version="1.0" xmlns:edmx="http://schemas.microsoft.com/ado/2007/06/edmx" '
+        'xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+        'xmlns:sap="http://www.successfactors.com/edm/sap"><edmx:DataServices>'
+        f'<Schema Namespace="SFOData" xmlns="http://schemas.microsoft.com/ado/2008/09/edm">{"".join(types)}</Schema>'
+        '<Schema Namespace="SFODataSet" xmlns="http://schemas.microsoft.com/ado/2008/09/edm"><EntityContainer>'
+        f'<EntitySet Name="Entity{doc_no}" EntityType="SFOData.Entity{doc_no}" sap:label="Entity {doc_no}"/>'
+        '</EntityContainer></Schema></edmx:DataServices></edmx:Edmx>'
+    )
+    return ET.ElementTree(ET.fromstring(xml))
+
+def legacy_extract(metadata_trees):
+    # The former implementation: one walk to collect attributes, one to build rows, three probes per attribute
+    rows = []
+    all_attrs = set()
+    for tree in metadata_trees.values():
+        root = tree.getroot()
+        for schema in root.findall('.//{http://schemas.microsoft.com/ado/2008/09/edm}Schema'):
+            if schema.attrib.get('Namespace') == 'SFOData':
+                for et in schema.findall('EntityType', ns):
+                    for prop in et.findall('Property', ns):
+                        all_attrs.update([clean_attr(a) for a in prop.attrib.keys()])
+                    for nav in et.findall('NavigationProperty', ns):
+                        all_attrs.update([clean_attr(a) for a in nav.attrib.keys()])
+    all_attrs = sorted(all_attrs)
+    all_attrs += ["Key", "Entity", "NavigationField"]
+    for tree in metadata_trees.values():
+        root = tree.getroot()
+        for schema in root.findall('.//{http://schemas.microsoft.com/ado/2008/09/edm}Schema'):
+            if schema.attrib.get('Namespace') == 'SFOData':
+                for et in schema.findall('EntityType', ns):
+                    entity_name = et.attrib.get('Name', 'Null')
+                    key_names = set()
+                    key = et.find('Key', ns)
+                    if key is not None:
+                        key_names = {pr.attrib.get('Name') for pr in key.findall('PropertyRef', ns)}
+                    for prop in et.findall('Property', ns):
+                        row = {}
+                        for attr in all_attrs:
+                            if attr in ["Key", "Entity", "NavigationField"]:
+                                continue
+                            row[attr] = get_attr_value(prop.attrib, attr)
+                        row["Key"] = "true" if prop.attrib.get("Name") in key_names else "false"
+                        row["Entity"] = entity_name
+                        row["NavigationField"] = "false"
+                        rows.append(row)
+                    for nav in et.findall('NavigationProperty', ns):
+                        row = {}
+                        for attr in all_attrs:
+                            if attr in ["Key", "Entity", "NavigationField"]:
+                                continue
+                            row[attr] = get_attr_value(nav.attrib, attr)
+                        row["Key"] = "false"
+                        row["Entity"] = entity_name
+                        row["NavigationField"] = "true"
+                        rows.append(row)
+    return pd.DataFrame(rows, columns=all_attrs)
+
+def single_pass_extract(metadata_trees):
+    seen_types = {}
+    metadata_records = {entity: list(tree_records(tree, seen_types)) for entity, tree in metadata_trees.items()}
+    entities, dict_columns = extract_dictionary(metadata_records)
+    return pd.DataFrame(dict_columns, columns=list(dict_columns))
+
+def best_of(func, metadata_trees):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        df = func(metadata_trees)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return df, best
+
+def main():
+    rng = random.Random(42)
+    metadata_trees = {f"Entity{i}": synthetic_document(i, rng) for i in range(DOCUMENTS)}
+    df_legacy, legacy_time = best_of(legacy_extract, metadata_trees)
+    df_single, single_time = best_of(single_pass_extract, metadata_trees)
+    # The single-pass engine emits each shared EntityType once and adds the RequestedBy column
+    pd.testing.assert_frame_equal(df_legacy.drop_duplicates().reset_index(drop=True), df_single.drop(columns="RequestedBy"))
+    print(f"Dictionary rows: {len(df_legacy)} -> {len(df_single)} after EntityType deduplication (outputs identical otherwise)")
+    print(f"Three-walk extraction:  {legacy_time:.3f}s")
+    print(f"Single-pass extraction: {single_time:.3f}s ({legacy_time / single_time:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import fnmatch
+import time
+
+# Entity set discovery shared by the scripts that query per entity set. Instead of the hard-coded ENTITY_SETS list,
+# the OData service document is read and every entity set it lists (custom MDF cust_* objects included) is
+# filtered through include/exclude patterns.
+
+def discover_entity_sets(session, api_server, timeout):
+    """Names of all entity sets in the service document of https://{api_server}/odata/v2/, in service order."""
+    url = f"https://{api_server}/odata/v2/?$format=json"
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    entity_sets = response.json().get("d", {}).get("EntitySets", [])
+    # Some gateways return the names as {"name": ...}/{"url": ...} objects instead of plain strings; entries
+    # without a usable name are left out
+    names = [name if isinstance(name, str) else name.get("name") or name.get("url")
+             for name in entity_sets if isinstance(name, (str, dict))]
+    return [name for name in names if name and isinstance(name, str)]
+
+def select_entity_sets(names, include, exclude):
+    """Names matching at least one include pattern and no exclude pattern, e.g. include=["Per*", "cust_*"].
+
+    Patterns are shell-style wildcards (fnmatch) and case-sensitive, like OData entity set names.
+    """
+    return [
+        name for name in names
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in include)
+        and not any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)
+    ]
+
+def resolve_entity_sets(session, api_server, timeout, configured, discover, include, exclude):
+    # The configured list, or the discovered one when discovery is enabled; discovery errors fall back to the list
+    if not discover:
+        return list(configured)
+    try:
+        names = discover_entity_sets(session, api_server, timeout)
+    except Exception as e:
+        print(f"Entity discovery failed ({e}), using the configured ENTITY_SETS")
+        return list(configured)
+    selected = select_entity_sets(names, include, exclude)
+    print(f"Discovered {len(names)} entity sets, {len(selected)} selected by the include/exclude patterns")
+    return selected
+
+class Progress:
+    """Prints "done/total" lines while a long batch of per-entity requests completes.
+
+    A line is printed every `every` completions (by default about every 5% of the batch) and for the last one.
+    """
+    def __init__(self, label, total, every=None):
+        self.label = label
+        self.total = total
+        self.every = every or max(1, total // 20)
+        self.done = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def update(self, failed=False):
+        self.done += 1
+        self.failed += failed
+        if self.done % self.every == 0 or self.done == self.total:
+            elapsed = time.perf_counter() - self.started
+            failed_text = f", {self.failed} failed" if self.failed else ""
+            print(f"{self.label}: {self.done}/{self.total} entities{failed_text} ({elapsed:.1f}s)")
@@ -0,0 +1,165 @@
+import random
+import re
+import threading
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import requests
+from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from requests.utils import requote_uri
+
+# Throttle-safe HTTP helpers for the scripts that call the OData API once per entity set. SuccessFactors answers
+# bursts with 429 (or 503 while a node is busy) and a Retry-After header, so every request goes through a per-host
+# rate limiter and is retried with jittered exponential backoff.
+
+RETRY_STATUSES = (429, 503)
+
+def build_session(username, password, pool_size):
+    # One keep-alive session shared by all workers, with a connection pool as large as the worker pool
+    session = requests.Session()
+    session.auth = HTTPBasicAuth(username, password)
+    session.verify = True
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+class HostRateLimiter:
+    """Spaces the requests to each host at least 1 / requests_per_second apart, across all threads.
+
+    A host that asked to be left alone (Retry-After) is paused for every thread, not only the one that was throttled.
+    """
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, host, seconds):
+        with self.lock:
+            self.next_slot[host] = max(self.next_slot.get(host, 0.0), time.monotonic() + seconds)
+
+def retry_after_seconds(response):
+    # Retry-After is either a number of seconds or an HTTP date; None when missing or unreadable
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(response, attempt, backoff_base, backoff_cap):
+    # The server's Retry-After plus a little jitter so throttled workers do not return in lockstep,
+    # otherwise "full jitter" exponential backoff
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None:
+        return min(backoff_cap, retry_after) + random.uniform(0, backoff_base)
+    return random.uniform(0, min(backoff_cap, backoff_base * 2 ** attempt))
+
+def send(session, method, url, limiter=None, max_retries=5, backoff_base=1.0, backoff_cap=60.0, **kwargs):
+    """session.request() behind the rate limiter, retrying 429/503 responses up to max_retries times.
+
+    The last response is returned as is once the retries are used up, so callers handle it like any other error.
+    """
+    host = urlsplit(url).netloc
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.wait(host)
+        response = session.request(method, url, **kwargs)
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            return response
+        delay = retry_delay(response, attempt, backoff_base, backoff_cap)
+        print(f"HTTP {response.status_code} from {host}, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+        response.close()
+        if limiter is not None:
+            limiter.pause(host, delay)
+        else:
+            time.sleep(delay)
+
+def build_batch_request(relative_urls, boundary):
+    """Multipart body of an OData v2 $batch request with one GET operation per relative URL.
+
+    Query operations are sent outside of changesets, since changesets may only hold modifying requests.
+    """
+    lines = []
+    for url in relative_urls:
+        lines += [
+            f"--{boundary}",
+            "Content-Type: application/http",
+            "Content-Transfer-Encoding: binary",
+            "",
+            f"GET {requote_uri(url)} HTTP/1.1",
+            "Accept: application/json",
+            "",
+            "",
+        ]
+    lines.append(f"--{boundary}--")
+    return "\r\n".join(lines).encode("utf-8"), f"multipart/mixed; boundary={boundary}"
+
+def split_head(data):
+    # Header block and the rest of a MIME part or HTTP message; servers differ in CRLF vs LF line ends
+    match = re.search(rb"\r?\n\r?\n", data)
+    if match is None:
+        return data, b""
+    return data[:match.start()], data[match.end():]
+
+def parse_header_lines(lines):
+    headers = {}
+    for line in lines:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+def parse_batch_response(content, content_type):
+    """(status, reason, body text) of every operation in a $batch response, in request order.
+
+    Changesets (nested multipart/mixed parts) are flattened into the same list.
+    """
+    match = re.search(r'boundary=(?:"([^"]+)"|([^;\s]+))', content_type or "")
+    if match is None:
+        raise ValueError(f"not a multipart response: {content_type}")
+    delimiter = b"--" + (match.group(1) or match.group(2)).encode("latin-1")
+    results = []
+    for part in content.split(delimiter)[1:]:
+        if part.startswith(b"--"):
+            break  # Closing delimiter
+        head, payload = split_head(part.lstrip(b"\r\n"))
+        part_headers = parse_header_lines(head.decode("latin-1").splitlines())
+        if part_headers.get("content-type", "").startswith("multipart/mixed"):
+            results.extend(parse_batch_response(payload, part_headers["content-type"]))
+            continue
+        head, body = split_head(payload)
+        status_line = head.decode("latin-1").splitlines()[0]
+        _, status, reason = (status_line.split(" ", 2) + [""])[:3]
+        results.append((int(status), reason, body.rstrip(b"\r\n").decode("utf-8")))
+    return results
+
+def send_batch(session, service_root, relative_urls, limiter=None, **kwargs):
+    """Runs GET queries (URLs relative to service_root) as one $batch round-trip; see parse_batch_response.
+
+    Keyword arguments are passed on to send(), so the batch request itself is rate limited and retried.
+    """
+    boundary = f"batch_{uuid.uuid4().hex}"
+    body, content_type = build_batch_request(relative_urls, boundary)
+    response = send(session, "POST", service_root + "$batch", limiter, data=body,
+                    headers={"Content-Type": content_type, "Accept": "multipart/mixed"}, **kwargs)
+    response.raise_for_status()
+    results = parse_batch_response(response.content, response.headers.get("Content-Type"))
+    if len(results) != len(relative_urls):
+        raise ValueError(f"$batch returned {len(results)} responses for {len(relative_urls)} requests")
+    return results
@@ -0,0 +1,165 @@
+import json
+
+# Incremental reading of OData v2 JSON query responses ({"d": {"results": [...], "__next": ...}}). Records are
+# decoded one at a time while the body downloads, so a caller that only needs the first record can stop reading,
+# and one that walks all of them never holds more than one record and one chunk in memory.
+
+def truncate(text, limit):
+    """text cut to limit characters for console logs, with a marker when something was left out."""
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text)} chars, truncated]"
+
+class ResultStream:
+    """Iterates over the records of a response body given as text chunks (e.g. iter_content(decode_unicode=True)).
+
+    Only the "results" array of the "d" object is streamed; once the records are exhausted, next_link holds d.__next
+    (None on the last page). A body of any other shape (a single entity, "d" as a plain array, an error document)
+    is parsed as a whole, as resp.json() did.
+    """
+    def __init__(self, chunks, preview_limit=2000):
+        self.chunks = iter(chunks)
+        self.preview_limit = preview_limit
+        self.head = ""
+        self.consumed = 0
+        self.complete = False
+        self.next_link = None
+        self.buffer = ""
+        self.position = 0
+
+    @property
+    def preview(self):
+        # The start of the body read so far, for logs
+        if self.complete and self.consumed <= self.preview_limit:
+            return self.head
+        return f"{self.head}... [{self.consumed} chars read, truncated]"
+
+    def read(self):
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.complete = True
+            return None
+        self.consumed += len(chunk)
+        if len(self.head) < self.preview_limit:
+            self.head += chunk[:self.preview_limit - len(self.head)]
+        return chunk
+
+    def fill(self):
+        # Appends the next chunk to the buffer; False at the end of the body
+        chunk = self.read()
+        if chunk is None:
+            return False
+        self.buffer += chunk
+        return True
+
+    def skip(self, separators=""):
+        # Moves past whitespace and separators; the next character, or None at the end of the body
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n" + separators:
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return None
+
+    def expect(self, character):
+        if self.skip() != character:
+            raise ValueError(f"expected {character!r} in the response envelope")
+        self.position += 1
+
+    def value(self, decoder):
+        # The JSON value at the current position, reading more of the body until it is complete
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise ValueError("response ended inside a JSON value")
+                continue
+            # A number at the end of the buffer may go on in the next chunk
+            if end < len(self.buffer) or not self.fill():
+                self.position = end
+                return value
+
+    def member(self, decoder):
+        # The key of the next member of the current object, positioned at its value; None after the last member
+        if self.skip(",") != '"':
+            return None
+        key = self.value(decoder)
+        self.expect(":")
+        self.skip()
+        return key
+
+    def find_results(self, decoder):
+        # Walks {"d": {...}} up to the start of d.results; False when the body has another shape
+        self.expect("{")
+        while True:
+            key = self.member(decoder)
+            if key is None:
+                return False
+            if key == "d":
+                break
+            self.value(decoder)
+        if self.skip() != "{":
+            return False
+        self.position += 1
+        while True:
+            key = self.member(decoder)
+            if key is None:
+                return False
+            if key == "results" and self.skip() == "[":
+                self.position += 1
+                return True
+            value = self.value(decoder)
+            if key == "__next":
+                self.next_link = value
+
+    def parse_whole(self):
+        while self.fill():
+            pass
+        d = json.loads(self.buffer).get("d", {})
+        if isinstance(d, list):
+            return d
+        self.next_link = d.get("__next")
+        result = d.get("results") or d.get("result", [])
+        return result if isinstance(result, list) else [result] if result else []
+
+    def __iter__(self):
+        decoder = json.JSONDecoder()
+        try:
+            found = self.find_results(decoder)
+        except ValueError:
+            found = False
+        if not found:
+            yield from self.parse_whole()
+            return
+        while True:
+            # Records already yielded are dropped, so only the current one and a chunk are held
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+            character = self.skip(",")
+            if character is None:
+                raise ValueError("response ended inside the results array")
+            if character == "]":
+                self.position += 1
+                break
+            yield self.value(decoder)
+        # After the array only the small remainder of d (__next) and the closing braces are left
+        key = self.member(decoder)
+        while key is not None:
+            value = self.value(decoder)
+            if key == "__next":
+                self.next_link = value
+            key = self.member(decoder)
+        self.drain()
+
+    def drain(self, limit=None):
+        """Reads the rest of the body unparsed, stopping once more than limit characters were read in total.
+
+        Returns True when the body was read to its end, so the connection behind it can be reused.
+        """
+        while not self.complete:
+            if limit is not None and self.consumed > limit:
+                return False
+            self.read()
+        return True
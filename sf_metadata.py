@@ -0,0 +1,251 @@
+import xml.etree.ElementTree as ET
+import hashlib
+import re
+
+# Parsing and extraction helpers for SuccessFactors OData $metadata (EDMX) documents,
+# shared by the dictionary extract and the scripts that reuse its metadata.
+
+ns = {
+    'edmx': 'http://schemas.microsoft.com/ado/2007/06/edmx',
+    'm': 'http://schemas.microsoft.com/ado/2007/08/dataservices/metadata',
+    '': 'http://schemas.microsoft.com/ado/2008/09/edm',
+    'sap': 'http://www.successfactors.com/edm/sap'
+}
+EDM = '{http://schemas.microsoft.com/ado/2008/09/edm}'
+entityset_cols = ['Name', 'label', 'creatable', 'updatable', 'upsertable', 'deletable']
+
+def get_text(node, tag):
+    el = node.find(tag, ns)
+    return el.text if el is not None else "Null"
+
+def get_sap_tags(doc):
+    tags = doc.find('.//sap:tagcollection', ns)
+    if tags is not None:
+        return ', '.join([t.text for t in tags.findall('sap:tag', ns)])
+    return "Null"
+
+def get_attr_value(attrib, attr):
+    if attr in attrib:
+        return attrib[attr]
+    if 'sap:' + attr in attrib:
+        return attrib['sap:' + attr]
+    sap_ns = '{http://www.successfactors.com/edm/sap}' + attr
+    if sap_ns in attrib:
+        return attrib[sap_ns]
+    return "Null"
+
+def clean_attr(attr):
+    return re.sub(r'^\{.*\}', '', attr).replace('sap:', '')
+
+def entity_set_record(es):
+    # One "EC Entity" row
+    doc = es.find('Documentation', ns)
+    row = {}
+    for col in entityset_cols:
+        if col == 'Name':
+            row['Name'] = es.attrib.get('Name', 'Null')
+        else:
+            row[col] = get_attr_value(es.attrib, col)
+    row['Summary'] = get_text(doc, 'Summary') if doc is not None else "Null"
+    row['LongDescription'] = get_text(doc, 'LongDescription') if doc is not None else "Null"
+    row['Sap Tagcollection'] = get_sap_tags(doc) if doc is not None else "Null"
+    return row
+
+def entity_type_record(et, seen_types=None):
+    # Entity name, key property names and the raw attributes of every Property/NavigationProperty.
+    # EntityTypes are identified by a hash of their content (tags, attributes and text of every element);
+    # a type already in seen_types (e.g. a navigation target repeated in many $metadata documents)
+    # is returned without parsing it again.
+    digest = hashlib.sha1(repr([(el.tag, el.attrib, el.text) for el in et.iter()]).encode("utf-8")).hexdigest()
+    if seen_types is not None and digest in seen_types:
+        return seen_types[digest]
+    key = et.find('Key', ns)
+    record = {
+        "Digest": digest,
+        "Name": et.attrib.get('Name', 'Null'),
+        "Key": {pr.attrib.get('Name') for pr in key.findall('PropertyRef', ns)} if key is not None else set(),
+        "Property": [dict(prop.attrib) for prop in et.findall('Property', ns)],
+        "NavigationProperty": [dict(nav.attrib) for nav in et.findall('NavigationProperty', ns)],
+    }
+    return record if seen_types is None else seen_types.setdefault(digest, record)
+
+def tree_records(tree, seen_types=None):
+    root = tree.getroot()
+    for schema in root.findall('.//' + EDM + 'Schema'):
+        if schema.attrib.get('Namespace') == 'SFODataSet':
+            for es in schema.findall('.//EntitySet', ns):
+                yield "EntitySet", entity_set_record(es)
+        elif schema.attrib.get('Namespace') == 'SFOData':
+            for et in schema.findall('EntityType', ns):
+                yield "EntityType", entity_type_record(et, seen_types)
+
+def iter_closed_elements(source):
+    # Walks the EDMX incrementally and yields (schema namespace, parent, element) for every closed element.
+    # Top-level definitions are dropped right after they are yielded, so memory is bounded by the largest
+    # single EntitySet/EntityType/Association instead of the whole document.
+    path = []
+    schema_ns = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if elem.tag == EDM + 'Schema':
+                schema_ns = elem.attrib.get('Namespace')
+            path.append(elem)
+            continue
+        path.pop()
+        parent = path[-1] if path else None
+        yield schema_ns, parent, elem
+        if elem.tag == EDM + 'Schema':
+            schema_ns = None
+        if parent is not None and parent.tag in (EDM + 'Schema', EDM + 'EntityContainer'):
+            parent.remove(elem)
+
+def parse_metadata_stream(source, seen_types=None):
+    for schema_ns, parent, elem in iter_closed_elements(source):
+        if elem.tag == EDM + 'EntitySet' and schema_ns == 'SFODataSet':
+            yield "EntitySet", entity_set_record(elem)
+        elif elem.tag == EDM + 'EntityType' and schema_ns == 'SFOData' and parent.tag == EDM + 'Schema':
+            yield "EntityType", entity_type_record(elem, seen_types)
+
+def local_name(qualified):
+    # "SFOData.PerPerson" -> "PerPerson"
+    return qualified.rsplit('.', 1)[-1]
+
+def index_service_metadata(source):
+    """One pass over the service-wide $metadata document, without keeping any parsed records.
+
+    Returns {"entity_sets": {EntitySet: EntityType}, "navigations": {EntityType: {NavigationProperty: (target
+    EntityType, to-many)}}, "related_types": {EntityType: [target EntityTypes]}}. Navigation targets are resolved
+    through the Associations; navigation properties whose Association is missing are left out.
+    """
+    entity_sets = {}
+    navigations = {}
+    association_ends = {}
+    for schema_ns, parent, elem in iter_closed_elements(source):
+        if elem.tag == EDM + 'EntitySet' and schema_ns == 'SFODataSet':
+            entity_sets[elem.attrib.get('Name')] = local_name(elem.attrib.get('EntityType', ''))
+        elif schema_ns == 'SFOData' and parent.tag == EDM + 'Schema':
+            if elem.tag == EDM + 'EntityType':
+                navigations[elem.attrib.get('Name')] = [
+                    (nav.attrib.get('Name'), (local_name(nav.attrib.get('Relationship', '')), nav.attrib.get('ToRole')))
+                    for nav in elem.findall('NavigationProperty', ns)
+                ]
+            elif elem.tag == EDM + 'Association':
+                for end in elem.findall('End', ns):
+                    association_ends[(elem.attrib.get('Name'), end.attrib.get('Role'))] = (
+                        local_name(end.attrib.get('Type', '')), end.attrib.get('Multiplicity') == '*'
+                    )
+    resolved = {
+        type_name: [(name, association_ends[end]) for name, end in navs if end in association_ends]
+        for type_name, navs in navigations.items()
+    }
+    return {
+        "entity_sets": entity_sets,
+        "navigations": {type_name: dict(navs) for type_name, navs in resolved.items()},
+        "related_types": {type_name: [target for _, (target, _) in navs] for type_name, navs in resolved.items()},
+    }
+
+def slice_service_metadata(source, index, entity_sets, seen_types=None):
+    """Second pass: the records each requested entity set's own $metadata document would contain.
+
+    That is its EntitySet, its EntityType and the EntityTypes it navigates to. Only these types are
+    parsed; entity sets missing from the index are left out so the caller can fetch them separately.
+    """
+    type_names = {}
+    for entity_set in entity_sets:
+        own_type = index["entity_sets"].get(entity_set)
+        if own_type is None:
+            continue
+        names = [own_type]
+        for related in index["related_types"].get(own_type, []):
+            if related not in names:
+                names.append(related)
+        type_names[entity_set] = names
+    wanted_types = {name for names in type_names.values() for name in names}
+    set_records = {}
+    type_records = {}
+    for schema_ns, parent, elem in iter_closed_elements(source):
+        if elem.tag == EDM + 'EntitySet' and schema_ns == 'SFODataSet' and elem.attrib.get('Name') in type_names:
+            set_records[elem.attrib.get('Name')] = entity_set_record(elem)
+        elif (elem.tag == EDM + 'EntityType' and schema_ns == 'SFOData' and parent.tag == EDM + 'Schema'
+                and elem.attrib.get('Name') in wanted_types):
+            type_records[elem.attrib.get('Name')] = entity_type_record(elem, seen_types)
+    return {
+        entity_set: [("EntitySet", set_records[entity_set])]
+                    + [("EntityType", type_records[name]) for name in type_names[entity_set] if name in type_records]
+        for entity_set in entity_sets if entity_set in set_records
+    }
+
+def records_fingerprint(records):
+    # Normalized fingerprint of one entity's metadata: its EntitySet rows and the content hashes of its EntityTypes
+    normalized = [(kind, rec["Digest"] if kind == "EntityType" else sorted(rec.items())) for kind, rec in records]
+    return hashlib.sha1(repr(normalized).encode("utf-8")).hexdigest()
+
+
+DICT_EXTRA_COLS = ["Key", "Entity", "NavigationField", "RequestedBy"]
+SAP_NS = '{http://www.successfactors.com/edm/sap}'
+_spellings = {}
+
+def attr_spelling(raw):
+    # Maps a raw attribute name to (column name, precedence). Precedence follows get_attr_value:
+    # plain name first, then "sap:" prefix, then the SAP namespace; None means the spelling is never read.
+    if raw not in _spellings:
+        name = clean_attr(raw)
+        for rank, spelling in enumerate((name, 'sap:' + name, SAP_NS + name)):
+            if raw == spelling:
+                _spellings[raw] = (name, rank)
+                break
+        else:
+            _spellings[raw] = (name, None)
+    return _spellings[raw]
+
+def extract_dictionary(metadata_records):
+    """Builds the "EC Entity" rows and the "EC Data API Dictionary" columns in a single pass.
+
+    Columns are widened on the fly: an attribute seen for the first time gets a new column that is
+    back-filled with "Null" for earlier rows. Each distinct EntityType is emitted once, and its
+    "RequestedBy" column lists every requested entity set whose $metadata contained it.
+    """
+    entities = []
+    columns = {}
+    extra = {col: [] for col in DICT_EXTRA_COLS}
+    requested_by = {}  # EntityType digest -> requested entity sets
+    row_digests = []
+    n = 0
+    for entity_set, records in metadata_records.items():
+        for kind, rec in records:
+            if kind == "EntitySet":
+                entities.append(rec)
+                continue
+            sources = requested_by.get(rec["Digest"])
+            if sources is not None:
+                if entity_set not in sources:
+                    sources.append(entity_set)
+                continue
+            requested_by[rec["Digest"]] = [entity_set]
+            for is_nav, attribs in ((False, rec["Property"]), (True, rec["NavigationProperty"])):
+                for attrib in attribs:
+                    best = {}
+                    for raw, value in attrib.items():
+                        name, rank = attr_spelling(raw)
+                        if name not in columns:
+                            columns[name] = []
+                        if rank is not None and (name not in best or rank < best[name][0]):
+                            best[name] = (rank, value)
+                    for name, (rank, value) in best.items():
+                        col = columns[name]
+                        if len(col) < n:
+                            col.extend(["Null"] * (n - len(col)))
+                        col.append(value)
+                    extra["Key"].append("true" if not is_nav and attrib.get("Name") in rec["Key"] else "false")
+                    extra["Entity"].append(rec["Name"])
+                    extra["NavigationField"].append("true" if is_nav else "false")
+                    row_digests.append(rec["Digest"])
+                    n += 1
+    extra["RequestedBy"] = [", ".join(requested_by[digest]) for digest in row_digests]
+    dict_columns = {}
+    for name in sorted(columns):
+        col = columns[name]
+        col.extend(["Null"] * (n - len(col)))
+        dict_columns[name] = col
+    dict_columns.update(extra)
+    return entities, dict_columns
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import time
+
+# Disk cache of raw $metadata documents, shared by the scripts that download them. Entries are revalidated with
+# conditional requests (ETag / Last-Modified), so an unchanged document costs a 304 instead of a full download.
+# Each entry is "<key>.xml" (the document) plus "<key>.json" (validators, fetch time and an optional fingerprint),
+# keyed by server, entity and user, since metadata depends on the user's permissions.
+
+SERVICE_DOCUMENT = "$metadata"  # Cache key of the service-wide document
+
+class MetadataCache:
+    def __init__(self, cache_dir, server, user, ttl, max_bytes):
+        self.cache_dir = cache_dir
+        self.server = server
+        self.user = user
+        self.ttl = ttl  # Seconds before an entry is dropped and downloaded in full again
+        self.max_bytes = max_bytes  # Least recently used entries are evicted above this size
+
+    def paths(self, entity):
+        key = hashlib.sha256(f"{self.server}|{entity}|{self.user}".encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + ".xml", base + ".json"
+
+    def load(self, entity):
+        # The entry's info, or None when it is missing or older than the TTL
+        xml_path, info_path = self.paths(entity)
+        try:
+            with open(info_path, encoding="utf-8") as f:
+                info = json.load(f)
+            if time.time() - info.get("fetched_at", 0) > self.ttl or not os.path.exists(xml_path):
+                return None
+            return info
+        except (OSError, ValueError):
+            return None
+
+    def commit(self, entity, response, fingerprint=None):
+        # The raw XML has already been written to "<key>.xml.tmp" by the caller
+        xml_path, info_path = self.paths(entity)
+        info = {
+            "server": self.server,
+            "entity": entity,
+            "user": self.user,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time(),
+            "fingerprint": fingerprint,
+        }
+        # Both files are written to temporary names first so an interrupted run never leaves a half-written entry
+        with open(info_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(xml_path + ".tmp", xml_path)
+        os.replace(info_path + ".tmp", info_path)
+
+    def evict(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            info_path = os.path.join(self.cache_dir, name)
+            xml_path = info_path[:-len(".json")] + ".xml"
+            try:
+                with open(info_path, encoding="utf-8") as f:
+                    fetched_at = json.load(f).get("fetched_at", 0)
+                size = os.path.getsize(xml_path)
+                last_used = os.path.getmtime(xml_path)
+            except (OSError, ValueError):
+                fetched_at, size, last_used = 0, 0, 0
+            entries.append((last_used, size, fetched_at, xml_path, info_path))
+        total = sum(entry[1] for entry in entries)
+        for last_used, size, fetched_at, xml_path, info_path in sorted(entries):
+            if now - fetched_at <= self.ttl and total <= self.max_bytes:
+                continue
+            for path in (xml_path, info_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+def conditional_headers(cached):
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    return headers
+
+def fetch_service_metadata(get, url, cache, max_bytes, use_cache=True):
+    """Downloads the service-wide $metadata to a local file and returns (path, temporary).
+
+    get(url, headers) performs the streamed GET. With use_cache the cached copy is reused while the server answers
+    304 and a new download replaces it; otherwise the document goes to a temporary file next to the cache entry,
+    which the caller removes. Documents above max_bytes raise RuntimeError.
+    """
+    cached = cache.load(SERVICE_DOCUMENT) if use_cache else None
+    xml_path = cache.paths(SERVICE_DOCUMENT)[0]
+    with get(url, conditional_headers(cached)) as response:
+        if response.status_code == 304 and cached:
+            print("Service metadata not modified, using cached copy")
+            os.utime(xml_path)  # Mark as recently used for eviction
+            return xml_path, False
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise RuntimeError(f"document is larger than {max_bytes} bytes")
+        os.makedirs(cache.cache_dir, exist_ok=True)
+        size = 0
+        try:
+            with open(xml_path + ".tmp", "wb") as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise RuntimeError(f"document is larger than {max_bytes} bytes")
+                    f.write(chunk)
+        except Exception:
+            os.remove(xml_path + ".tmp")
+            raise
+        if not use_cache:
+            return xml_path + ".tmp", True
+        cache.commit(SERVICE_DOCUMENT, response)
+    return xml_path, False
@@ -0,0 +1,333 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from sf_replay import Cassette, exchange_key
+
+# Local stand-in for the SuccessFactors OData v2 API, for offline benchmarks and regression runs of the pipeline.
+# It answers the service document, entity and service-wide $metadata, entity queries, $batch and upsert, either
+# from exchanges recorded with HTTP_MODE = "record" (--cassettes) or from synthetic data generated per entity
+# name. --latency and --rate simulate a remote, throttling tenant.
+#
+#   python sf_mock_server.py --port 8765 --latency 0.05 --rate 20
+#
+# and set HTTP_MODE = "mock", MOCK_SERVER = "127.0.0.1:8765" in the scripts.
+
+DEFAULT_ENTITY_SETS = [
+    "User", "PerPerson", "EmpEmployment", "EmpJob", "PerPersonal", "PerGlobalInfoMEX",
+    "EmpJobRelationships", "EmpCompensation", "EmpPayCompRecurring", "EmpPayCompNonRecurring", "EmpWorkPermit",
+    "PerNationalId", "PerEmail", "PerPhone", "PerPersonRelationship", "PerAddressDEFLT", "PerEmergencyContacts",
+    "PaymentInformationV3", "PaymentInformationDetailV3", "Background_OutsideWorkExperience", "Background_Education",
+    "Background_Certificates", "Background_Languages"
+]
+EMPLOYEE_KEYS = [
+    ("User", "userId"), ("Emp", "userId"), ("Background", "userId"), ("Per", "personIdExternal"),
+    ("PaymentInformationV3", "worker"), ("PaymentInformationDetailV3", "PaymentInformationV3_worker"),
+]
+SAP_FLAGS = ["required", "creatable", "updatable", "upsertable", "visible", "sortable", "filterable"]
+EDMX_HEAD = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<edmx:Edmx Version="1.0" xmlns:edmx="http://schemas.microsoft.com/ado/2007/06/edmx" '
+    'xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+    'xmlns:sap="http://www.successfactors.com/edm/sap"><edmx:DataServices m:DataServiceVersion="2.0">'
+)
+
+class SyntheticTenant:
+    """Deterministic metadata and records for any entity set name; the same name always gives the same data."""
+    def __init__(self, entity_sets, records, page_size, properties):
+        self.entity_sets = entity_sets
+        self.records = records
+        self.page_size = page_size
+        self.properties = properties
+
+    def employee_key(self, entity):
+        return next((key for prefix, key in EMPLOYEE_KEYS if entity.startswith(prefix)), "externalCode")
+
+    def fields(self, entity):
+        # (name, is_key, attributes) of the entity's properties
+        rng = random.Random(entity)
+        fields = [(self.employee_key(entity), True, {"sap:upsertable": "true", "sap:required": "true"})]
+        if entity.startswith("Per") and entity not in ("PerPerson", "PerPersonal"):
+            fields.append(("isPrimary", False, {"Type": "Edm.Boolean", "sap:upsertable": "true"}))
+        for i in range(self.properties):
+            attrs = {f"sap:{flag}": rng.choice(["true", "true", "false"]) for flag in SAP_FLAGS}
+            attrs["MaxLength"] = str(rng.randint(10, 255))
+            if i % 5 == 4:
+                attrs["sap:picklist"] = f"{entity}Picklist{i}"
+            fields.append((f"{entity[0].lower()}{entity[1:]}Field{i}", i == 0, attrs))
+        for name in ("createdBy", "lastModifiedDateTime"):
+            fields.append((name, False, {"sap:upsertable": "false"}))
+        return fields
+
+    def entity_type(self, entity):
+        props = []
+        for name, is_key, attrs in self.fields(entity):
+            attrs = dict({"Type": "Edm.String", "sap:label": f"{name} label"}, **attrs)
+            props.append(f'<Property Name="{name}" ' + " ".join(f'{k}="{v}"' for k, v in attrs.items()) + "/>")
+        keys = "".join(f'<PropertyRef Name="{name}"/>' for name, is_key, attrs in self.fields(entity) if is_key)
+        navs = "".join(
+            f'<NavigationProperty Name="{name}" Relationship="SFOData.{entity}_{name}" FromRole="{entity}" '
+            f'ToRole="{name}" sap:upsertable="false" sap:label="{target}"/>'
+            for name, (target, many) in self.navigations(entity).items()
+        )
+        return f'<EntityType Name="{entity}"><Key>{keys}</Key>{"".join(props)}{navs}</EntityType>'
+
+    def navigations(self, entity):
+        # {name: (target entity, to-many)}: every entity refers to its User, and a User to the records of every entity
+        if entity != "User":
+            return {"userNav": ("User", False)}
+        return {f"{other[0].lower()}{other[1:]}Nav": (other, True) for other in self.entity_sets if other != "User"}
+
+    def associations(self, entity):
+        return "".join(
+            f'<Association Name="{entity}_{name}"><End Role="{entity}" Type="SFOData.{entity}" Multiplicity="1"/>'
+            f'<End Role="{name}" Type="SFOData.{target}" Multiplicity="{"*" if many else "1"}"/></Association>'
+            for name, (target, many) in self.navigations(entity).items()
+        )
+
+    def entity_set(self, entity):
+        return (f'<EntitySet Name="{entity}" EntityType="SFOData.{entity}" sap:label="{entity}" sap:creatable="true" '
+                'sap:updatable="true" sap:upsertable="true" sap:deletable="false"><Documentation>'
+                f'<Summary>{entity} summary</Summary><LongDescription>{entity} description</LongDescription>'
+                '<sap:tagcollection><sap:tag>Employee Central (EC)</sap:tag></sap:tagcollection></Documentation></EntitySet>')
+
+    def metadata(self, entity_sets, with_associations=False):
+        types = sorted(set(entity_sets) | ({"User"} if any(entity != "User" for entity in entity_sets) else set()))
+        associations = "".join(self.associations(entity) for entity in types) if with_associations else ""
+        return (
+            EDMX_HEAD + '<Schema Namespace="SFOData" xmlns="http://schemas.microsoft.com/ado/2008/09/edm">'
+            + "".join(self.entity_type(entity) for entity in types) + associations + "</Schema>"
+            '<Schema Namespace="SFODataSet" xmlns="http://schemas.microsoft.com/ado/2008/09/edm">'
+            '<EntityContainer Name="EntityContainer" m:IsDefaultEntityContainer="true">'
+            + "".join(self.entity_set(entity) for entity in entity_sets)
+            + "</EntityContainer></Schema></edmx:DataServices></edmx:Edmx>"
+        ).encode("utf-8")
+
+    def record(self, entity, index, employee=None):
+        rng = random.Random(f"{entity}/{index}")
+        key = self.employee_key(entity)
+        record = {"__metadata": {"uri": f"https://localhost/odata/v2/{entity}({key}='{employee or index}')", "type": f"SFOData.{entity}"}}
+        for name, is_key, attrs in self.fields(entity):
+            if name == key:
+                record[name] = employee or f"E{index:05d}"
+            elif attrs.get("Type") == "Edm.Boolean":
+                record[name] = index == 0
+            else:
+                record[name] = rng.choice([None, "", f"{name[-2:]}{rng.randint(0, 20)}", f"value {rng.randint(0, 999)}"])
+        for name in self.navigations(entity):
+            record[name] = {"__deferred": {"uri": f"https://localhost/odata/v2/{entity}/{name}"}}
+        return record
+
+    def expand(self, entity, record, paths):
+        # Replaces the deferred navigation properties named by $expand paths ("a", "a/b") with the related records
+        # of the same employee
+        employee = record.get(self.employee_key(entity))
+        children = {}
+        for path in paths:
+            name, _, rest = path.partition("/")
+            children.setdefault(name, [])
+            if rest:
+                children[name].append(rest)
+        for name, rest in children.items():
+            if name not in self.navigations(entity):
+                raise KeyError(name)
+            target, many = self.navigations(entity)[name]
+            related = self.expand(target, self.record(target, 0, employee), rest)
+            record[name] = {"results": [related]} if many else related
+        return record
+
+    def select(self, record, fields):
+        # $select paths: "a" keeps a property, "nav/a" a property of an expanded navigation property
+        keep = {}
+        for field in fields:
+            name, _, rest = field.partition("/")
+            keep.setdefault(name, [])
+            if rest:
+                keep[name].append(rest)
+        selected = {}
+        for name, value in record.items():
+            if name == "__metadata" or name in keep:
+                nested = keep.get(name)
+                if nested and isinstance(value, dict) and "results" in value:
+                    value = {"results": [self.select(item, nested) for item in value["results"]]}
+                elif nested and isinstance(value, dict) and "__deferred" not in value:
+                    value = self.select(value, nested)
+                selected[name] = value
+        return selected
+
+    def query(self, entity, query, service_root):
+        # Filter on the employee key (always one match), $top, $select, $expand and server-side paging with __next/$skiptoken
+        match = re.search(r"(\w+) eq '([^']*)'", query.get("$filter", [""])[0])
+        end = top = 0
+        if match:
+            records = [self.record(entity, 0, match.group(2))]
+        else:
+            skip = int(query.get("$skiptoken", ["0"])[0])
+            top = int(query.get("$top", [str(self.records)])[0])
+            end = min(self.records, top, skip + self.page_size)
+            records = [self.record(entity, i) for i in range(skip, end)]
+        if "$expand" in query:
+            records = [self.expand(entity, record, query["$expand"][0].split(",")) for record in records]
+        if "$select" in query:
+            records = [self.select(record, query["$select"][0].split(",")) for record in records]
+        d = {"results": records}
+        if not match and end < min(self.records, top):
+            rest = {k: v[0] for k, v in query.items() if k != "$skiptoken"}
+            d["__next"] = f"{service_root}{entity}?" + "&".join(f"{k}={v}" for k, v in rest.items()) + f"&$skiptoken={end}"
+        return d
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts of up to `rate`; 0 disables throttling."""
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        if not self.rate:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+def batch_operations(body, content_type):
+    # (method, relative URL) of every operation in a $batch request body
+    boundary = re.search(r'boundary=(?:"([^"]+)"|([^;\s]+))', content_type)
+    delimiter = "--" + (boundary.group(1) or boundary.group(2))
+    return re.findall(r"^(GET|POST) (\S+) HTTP/1\.1", body.decode("utf-8").replace(delimiter, "\n"), re.M)
+
+def batch_response(parts):
+    boundary = f"batchresponse_{random.getrandbits(64):016x}"
+    chunks = []
+    for status, reason, body in parts:
+        chunks.append(
+            f"--{boundary}\r\nContent-Type: application/http\r\nContent-Transfer-Encoding: binary\r\n\r\n"
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json;charset=utf-8\r\n\r\n".encode("utf-8")
+            + body + b"\r\n"
+        )
+    chunks.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real API behind the scripts' pooled sessions
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not self.server.bucket.take():
+            self.send(429, "Too Many Requests", b'{"error": "throttled"}', {"Retry-After": "1"})
+            return
+        status, reason, payload, headers = self.route(self.command, self.path, body, self.headers.get("Content-Type"))
+        etag = headers.get("ETag")
+        if status == 200 and etag and self.headers.get("If-None-Match") == etag:
+            status, reason, payload = 304, "Not Modified", b""
+        self.send(status, reason, payload, headers)
+
+    def send(self, status, reason, payload, headers):
+        self.send_response(status, reason)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def route(self, method, target, body, content_type):
+        if self.server.cassette is not None:
+            recorded = self.server.cassette.load(exchange_key(method, target, body, content_type))
+            if recorded is not None:
+                info, payload = recorded
+                return info["status"], info["reason"], payload, info["headers"]
+        tenant = self.server.tenant
+        parts = urlsplit(target)
+        path = parts.path[len("/odata/v2"):].strip("/")
+        query = parse_qs(parts.query)
+        if method == "GET" and path == "":
+            names = json.dumps({"d": {"EntitySets": tenant.entity_sets}}).encode("utf-8")
+            return 200, "OK", names, {"Content-Type": "application/json"}
+        if method == "GET" and path.endswith("$metadata"):
+            entity = path[:-len("$metadata")].strip("/")
+            document = tenant.metadata([entity] if entity else tenant.entity_sets, with_associations=not entity)
+            return 200, "OK", document, {"Content-Type": "application/xml", "ETag": f'"{hashlib.md5(document).hexdigest()}"'}
+        if method == "POST" and path == "$batch":
+            results = []
+            for op_method, url in batch_operations(body, content_type):
+                status, reason, payload, headers = self.route(op_method, "/odata/v2/" + url, b"", None)
+                results.append((status, reason, payload))
+            payload, batch_type = batch_response(results)
+            return 202, "Accepted", payload, {"Content-Type": batch_type}
+        if method == "POST" and path == "upsert":
+            records = json.loads(body or b"[]")
+            records = records if isinstance(records, list) else [records]
+            results = [
+                {"key": record.get("__metadata", {}).get("uri"), "status": "OK", "editStatus": "UPSERTED",
+                 "message": None, "index": i, "httpCode": 200, "inlineResults": None}
+                for i, record in enumerate(records)
+            ]
+            return 200, "OK", json.dumps({"d": results}).encode("utf-8"), {"Content-Type": "application/json"}
+        if method == "GET" and path and "/" not in path:
+            try:
+                d = tenant.query(path, query, f"http://{self.headers.get('Host', 'localhost')}/odata/v2/")
+            except KeyError as e:
+                error = {"error": {"code": "COE_PROPERTY_NOT_FOUND", "message": {"value": f"Navigation property {e} not found"}}}
+                return 400, "Bad Request", json.dumps(error).encode("utf-8"), {"Content-Type": "application/json"}
+            return 200, "OK", json.dumps({"d": d}).encode("utf-8"), {"Content-Type": "application/json"}
+        return 404, "Not Found", b'{"error": "not found"}', {"Content-Type": "application/json"}
+
+def serve(port, tenant, cassette_dir=None, latency=0.0, rate=0, verbose=False):
+    """Starts the server in a background thread and returns it; call shutdown() to stop it."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    server.tenant = tenant
+    server.cassette = Cassette(cassette_dir) if cassette_dir else None
+    server.latency = latency
+    server.bucket = TokenBucket(rate)
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local SuccessFactors OData v2 stand-in server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cassettes", help="Serve exchanges recorded with HTTP_MODE = 'record' from this folder first")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--rate", type=float, default=0, help="Requests per second before answering 429 (0 = unlimited)")
+    parser.add_argument("--custom-entities", type=int, default=0, help="Extra synthetic cust_* entity sets in the service document")
+    parser.add_argument("--records", type=int, default=5, help="Synthetic records per entity set")
+    parser.add_argument("--page-size", type=int, default=1000, help="Records per page before __next paging")
+    parser.add_argument("--properties", type=int, default=20, help="Synthetic properties per entity type")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+    entity_sets = DEFAULT_ENTITY_SETS + [f"cust_Synthetic{i}" for i in range(args.custom_entities)]
+    tenant = SyntheticTenant(entity_sets, args.records, args.page_size, args.properties)
+    server = serve(args.port, tenant, args.cassettes, args.latency, args.rate, args.verbose)
+    print(f"Mock SuccessFactors API on http://127.0.0.1:{args.port}/odata/v2/ ({len(entity_sets)} entity sets), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import fnmatch
+import json
+import re
+from string import Formatter
+
+# Precompiled upsert payloads. Each entity's sample upsert is parsed once and compiled into JSON text with
+# substitution slots, so a body for a hire is rendered with str.format_map instead of parsing, editing and dumping
+# the sample again. The substitutions are read from a rule file:
+#
+#   {"substitutions": [
+#       {"fields": ["userId", "personIdExternal"], "value": "{EMPLOYEE_ID}"},
+#       {"fields": ["startDate"], "value": "{HIRE_DATE}", "except_entities": ["Background*"]},
+#       {"fields": ["__metadata.uri"], "pattern": "apiDemo\\.successfactors\\.com", "value": "{TEST_API_SERVER}"}
+#   ]}
+#
+# "fields" are top-level keys of the body, or dotted paths into nested objects. "value" is the new text with
+# {NAME} placeholders for the values passed when rendering. Without "pattern" it replaces the whole field;
+# with a regular expression "pattern" it replaces each match in the sample's text. "entities" and
+# "except_entities" limit a rule to entity names (fnmatch patterns). Every matching rule is applied, in file order.
+
+def load_substitutions(path):
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    return rules["substitutions"] if isinstance(rules, dict) else rules
+
+def format_parts(text):
+    # "{EMPLOYEE_ID}@dummy.com" -> [(True, "EMPLOYEE_ID"), (False, "@dummy.com")]
+    parts = []
+    for literal, name, _, _ in Formatter().parse(text):
+        if literal:
+            parts.append((False, literal))
+        if name is not None:
+            parts.append((True, name))
+    return parts
+
+def compile_substitutions(rules, names):
+    """Checks the rules and their placeholders against the value names that will be passed when rendering."""
+    compiled = []
+    for i, rule in enumerate(rules):
+        if not rule.get("fields") or "value" not in rule:
+            raise ValueError(f"substitution {i + 1} needs \"fields\" and \"value\": {rule}")
+        parts = format_parts(rule["value"])
+        unknown = sorted({name for is_slot, name in parts if is_slot} - set(names))
+        if unknown:
+            raise ValueError(f"substitution {i + 1} uses unknown placeholders {unknown}; known are {sorted(names)}")
+        compiled.append({
+            "fields": set(rule["fields"]),
+            "parts": parts,
+            "pattern": re.compile(rule["pattern"]) if rule.get("pattern") else None,
+            "entities": rule.get("entities"),
+            "except_entities": rule.get("except_entities", []),
+        })
+    return compiled
+
+def applies_to(rule, entity):
+    entity = str(entity)
+    if rule["entities"] is not None and not any(fnmatch.fnmatchcase(entity, p) for p in rule["entities"]):
+        return False
+    return not any(fnmatch.fnmatchcase(entity, p) for p in rule["except_entities"])
+
+def substitute_pattern(parts, rule):
+    # Replaces the pattern's matches in the literal text only; inserted values are never matched again
+    result = []
+    for is_slot, text in parts:
+        if is_slot:
+            result.append((True, text))
+            continue
+        position = 0
+        for match in rule["pattern"].finditer(text):
+            result.append((False, text[position:match.start()]))
+            result.extend(rule["parts"])
+            position = match.end()
+        result.append((False, text[position:]))
+    return [(is_slot, text) for is_slot, text in result if is_slot or text]
+
+def dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+def literal(json_text):
+    # JSON text inside a str.format template
+    return json_text.replace("{", "{{").replace("}", "}}")
+
+def string_template(parts):
+    # (template of a JSON string, its slot names; None when it always has literal text)
+    text = "".join(literal(dumps(part)[1:-1]) if not is_slot else "{" + part + "}" for is_slot, part in parts)
+    slots = tuple(part for is_slot, part in parts if is_slot)
+    blank_when = None if any(not is_slot for is_slot, _ in parts) else slots
+    return '"' + text + '"', blank_when
+
+def compile_value(value, path, entity, rules):
+    # (template of the value's JSON text, blank_when); blank_when is () for a value that is always blank
+    # (None or ""), the slots that make it blank when all of them render empty, or None if it never is
+    matching = [rule for rule in rules if path in rule["fields"] and applies_to(rule, entity)]
+    parts = [(False, value)] if isinstance(value, str) else None
+    for rule in matching:
+        if rule["pattern"] is None:
+            parts = list(rule["parts"])
+        elif parts is not None:
+            parts = substitute_pattern(parts, rule)
+    if matching and parts is not None:
+        return string_template([part for part in parts if part[0] or part[1]])
+    if isinstance(value, dict):
+        members = [literal(dumps(key)) + ": " + compile_value(item, f"{path}.{key}", entity, rules)[0]
+                   for key, item in value.items()]
+        return "{{" + ", ".join(members) + "}}", None
+    return literal(dumps(value)), () if value in [None, ""] else None
+
+class PayloadTemplate:
+    """An entity's sample upsert compiled into JSON text with slots; see compile_template."""
+    def __init__(self, entity, members):
+        self.entity = entity
+        self.body = "{{" + ", ".join(member for member, _ in members) + "}}"
+        # The valid body leaves out the top-level values that are blank
+        self.valid_members = [(member, blank_when) for member, blank_when in members if blank_when != ()]
+        self.valid = None
+        if all(blank_when is None for _, blank_when in self.valid_members):
+            self.valid = "{{" + ", ".join(member for member, _ in self.valid_members) + "}}"
+
+    def render(self, values):
+        """JSON text of the body; values come from slot_values()."""
+        return self.body.format_map(values)
+
+    def render_valid(self, values):
+        """JSON text of the body without its blank top-level values."""
+        if self.valid is not None:
+            return self.valid.format_map(values)
+        members = [member.format_map(values) for member, blank_when in self.valid_members
+                   if not (blank_when and all(values[slot] == "" for slot in blank_when))]
+        return "{" + ", ".join(members) + "}"
+
+def parse_sample(json_str):
+    # Samples are JSON objects, some stored with single quotes
+    try:
+        data = json.loads(json_str)
+    except ValueError:
+        data = json.loads(json_str.replace("'", '"'))
+    if not isinstance(data, dict):
+        raise ValueError(f"sample upsert is not a JSON object: {json_str[:100]}")
+    return data
+
+def compile_template(json_str, entity, rules):
+    """PayloadTemplate of one sample upsert under compiled substitution rules (see compile_substitutions)."""
+    data = parse_sample(json_str)
+    members = []
+    for key, value in data.items():
+        template, blank_when = compile_value(value, key, entity, rules)
+        members.append((literal(dumps(key)) + ": " + template, blank_when))
+    return PayloadTemplate(entity, members)
+
+def slot_values(values):
+    # Values escaped for use inside JSON strings, computed once per hire and shared by all its templates
+    return {name: dumps(str(value))[1:-1] for name, value in values.items()}
@@ -0,0 +1,122 @@
+import hashlib
+import heapq
+import json
+
+# Incremental per-field statistics over the records of an entity set. Records are added one at a time as they are
+# streamed from the API and are not kept, so memory depends on the number of fields and the sketch sizes below,
+# not on the number of records profiled.
+
+DISTINCT_SKETCH_SIZE = 1024  # Smallest hashes kept per field; distinct counts up to this size are exact
+TOP_VALUE_SLOTS = 256  # Values tracked per field for the most common values (Misra-Gries summary)
+PROFILE_HEADERS = ["Entity", "Field", "Records", "Null Ratio", "Distinct Values", "Min Length", "Max Length", "Most Common Values"]
+
+def value_text(value):
+    # Text form used for lengths, hashing and display; JSON for lists so equal values compare equal
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, sort_keys=True)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+class FieldProfile:
+    """Statistics of one field: null ratio, distinct count estimate, min/max length and most common values.
+
+    Distinct values are estimated with a k-minimum-values sketch, capped at the number of values seen. The most
+    common values come from a Misra-Gries summary, so their counts are lower bounds that are exact while a field has
+    at most TOP_VALUE_SLOTS values. Only counters above the decrement floor (the number of times all counters were
+    decreased, and at least one) are reported; below it a count says nothing about the value's frequency.
+    """
+    def __init__(self, sketch_size=DISTINCT_SKETCH_SIZE, top_slots=TOP_VALUE_SLOTS):
+        self.sketch_size = sketch_size
+        self.top_slots = top_slots
+        self.count = 0
+        self.nulls = 0
+        self.min_length = None
+        self.max_length = None
+        self.sketch = []  # Max-heap (negated) of the smallest hashes seen
+        self.sketched = set()
+        self.counters = {}
+        self.decrements = 0  # Times every counter was decreased because no slot was free
+
+    def add(self, value):
+        self.count += 1
+        if value is None or value == "":
+            self.nulls += 1
+            return
+        text = value_text(value)
+        length = len(text)
+        self.min_length = length if self.min_length is None else min(self.min_length, length)
+        self.max_length = length if self.max_length is None else max(self.max_length, length)
+        self.add_to_sketch(text)
+        self.add_to_counters(text)
+
+    def add_to_sketch(self, text):
+        h = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+        if h in self.sketched:
+            return
+        if len(self.sketch) < self.sketch_size:
+            heapq.heappush(self.sketch, -h)
+            self.sketched.add(h)
+        elif h < -self.sketch[0]:
+            self.sketched.discard(-heapq.heappushpop(self.sketch, -h))
+            self.sketched.add(h)
+
+    def add_to_counters(self, text):
+        if text in self.counters:
+            self.counters[text] += 1
+        elif len(self.counters) < self.top_slots:
+            self.counters[text] = 1
+        else:
+            # No free slot: every counter drops by one and the values that reach zero give up their slot
+            self.decrements += 1
+            for key in list(self.counters):
+                self.counters[key] -= 1
+                if not self.counters[key]:
+                    del self.counters[key]
+
+    @property
+    def null_ratio(self):
+        return self.nulls / self.count if self.count else 0.0
+
+    @property
+    def distinct(self):
+        if len(self.sketch) < self.sketch_size:
+            return len(self.sketch)
+        # k-th smallest of k uniformly distributed hashes in [0, 2**64); there cannot be more distinct values
+        # than non-null values
+        estimate = round((self.sketch_size - 1) * 2 ** 64 / (-self.sketch[0] + 1))
+        return min(estimate, self.count - self.nulls)
+
+    def most_common(self, n):
+        floor = max(self.decrements, 1)
+        common = [(value, count) for value, count in self.counters.items() if count > floor]
+        return sorted(common, key=lambda item: (-item[1], item[0]))[:n]
+
+class EntityProfile:
+    """FieldProfile of every field of an entity set, in the order the fields first appear."""
+    def __init__(self, **field_options):
+        self.field_options = field_options
+        self.records = 0
+        self.fields = {}
+
+    def add(self, record):
+        # record as cleaned for the sample sheets (see clean_json in script 3); nested objects are skipped there
+        self.records += 1
+        for name, value in record.items():
+            field = self.fields.get(name)
+            if field is None:
+                field = self.fields[name] = FieldProfile(**self.field_options)
+                field.count = field.nulls = self.records - 1  # Missing from the earlier records
+            field.add(value)
+        for name, field in self.fields.items():
+            if field.count < self.records:
+                field.add(None)
+
+    def rows(self, entity, top_values):
+        # One row per field, columns as in PROFILE_HEADERS
+        rows = []
+        for name, field in self.fields.items():
+            common = ", ".join(f"{value} ({count})" for value, count in field.most_common(top_values))
+            rows.append([entity, name, field.count, round(field.null_ratio, 4), field.distinct,
+                         field.min_length, field.max_length, common])
+        return rows
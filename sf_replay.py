@@ -0,0 +1,137 @@
+import hashlib
+import io
+import json
+import os
+import re
+from urllib.parse import urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from urllib3.response import HTTPResponse
+
+# Record/replay layer for the scripts that call SuccessFactors. HTTP_MODE in each script selects how its session
+# reaches the API:
+#   "live"   - straight to API_SERVER (default)
+#   "record" - to API_SERVER, and every exchange ($metadata, GET queries, $batch, upsert) is saved in CASSETTE_DIR
+#   "replay" - from CASSETTE_DIR only, without any network access; unrecorded requests fail
+#   "mock"   - to the local stand-in server at MOCK_SERVER (see sf_mock_server.py)
+# Exchanges are keyed by method, path, query and body, not by host, so a recording also works against the mock
+# server. Request headers (credentials included) are never written to disk.
+
+HTTP_MODES = ("live", "record", "replay", "mock")
+CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since")
+DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")  # The body is stored decoded
+
+def exchange_key(method, url, body=None, content_type=None):
+    parts = urlsplit(url)
+    if body is None:
+        body = b""
+    elif isinstance(body, str):
+        body = body.encode("utf-8")
+    # $batch boundaries are random per request and would make every recording unique
+    match = re.search(r'boundary=(?:"([^"]+)"|([^;\s]+))', content_type or "")
+    if match:
+        body = body.replace((match.group(1) or match.group(2)).encode("latin-1"), b"BOUNDARY")
+    target = parts.path + ("?" + parts.query if parts.query else "")
+    return hashlib.sha256(method.upper().encode() + b" " + target.encode("utf-8") + b"\n" + body).hexdigest()
+
+def request_key(request):
+    return exchange_key(request.method, request.url, request.body, request.headers.get("Content-Type"))
+
+class Cassette:
+    """One "<key>.json" (request line, status, headers) and one "<key>.body" file per recorded exchange."""
+    def __init__(self, directory):
+        self.directory = directory
+
+    def paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".body"
+
+    def load(self, key):
+        info_path, body_path = self.paths(key)
+        try:
+            with open(info_path, encoding="utf-8") as f:
+                info = json.load(f)
+            with open(body_path, "rb") as f:
+                return info, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, method, url, status, reason, headers, body):
+        os.makedirs(self.directory, exist_ok=True)
+        info_path, body_path = self.paths(key)
+        info = {"method": method, "url": url, "status": status, "reason": reason, "headers": headers}
+        # Temporary names first, so concurrent workers never read a half-written entry
+        with open(body_path + ".tmp", "wb") as f:
+            f.write(body)
+        with open(info_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(info, f, indent=1)
+        os.replace(body_path + ".tmp", body_path)
+        os.replace(info_path + ".tmp", info_path)
+
+def not_modified(request, headers):
+    # Conditional requests are answered from the recorded validators, so replays work with or without a metadata cache
+    lower = {name.lower(): value for name, value in headers.items()}
+    etag = request.headers.get("If-None-Match")
+    since = request.headers.get("If-Modified-Since")
+    return bool((etag and etag == lower.get("etag")) or (since and since == lower.get("last-modified")))
+
+class ReplayAdapter(HTTPAdapter):
+    """Serves every request from the cassette."""
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        recorded = self.cassette.load(request_key(request))
+        if recorded is None:
+            raise ConnectionError(f"No recorded exchange for {request.method} {request.url}", request=request)
+        info, body = recorded
+        return self.build_recorded_response(request, info["status"], info["reason"], info["headers"], body)
+
+    def build_recorded_response(self, request, status, reason, headers, body):
+        if status == 200 and not_modified(request, headers):
+            status, reason, body = 304, "Not Modified", b""
+        raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status, reason=reason,
+                           preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
+
+class RecordingAdapter(ReplayAdapter):
+    """Sends every request to the server and saves the exchange before handing it back."""
+    def send(self, request, **kwargs):
+        # Always record the full document: conditional headers are answered locally like in a replay
+        conditional = {name: request.headers.pop(name) for name in CONDITIONAL_HEADERS if name in request.headers}
+        response = HTTPAdapter.send(self, request, **kwargs)
+        body = response.content
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in DROPPED_HEADERS}
+        self.cassette.save(request_key(request), request.method, request.url, response.status_code, response.reason,
+                           headers, body)
+        request.headers.update(conditional)
+        return self.build_recorded_response(request, response.status_code, response.reason, headers, body)
+
+class MockServerAdapter(HTTPAdapter):
+    """Sends every request to the local stand-in server, keeping its path and query."""
+    def __init__(self, server, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = urlunsplit(("http", self.server, parts.path, parts.query, parts.fragment))
+        return super().send(request, **kwargs)
+
+def use_http_mode(session, mode, cassette_dir, mock_server, pool_size=10):
+    """Mounts the adapter for HTTP_MODE on the session (see the top of this module) and returns the session."""
+    if mode not in HTTP_MODES:
+        raise ValueError(f"HTTP_MODE must be one of {HTTP_MODES}, not {mode!r}")
+    if mode == "live":
+        return session
+    pool = {"pool_connections": 1, "pool_maxsize": max(1, pool_size)}
+    if mode == "record":
+        adapter = RecordingAdapter(Cassette(cassette_dir), **pool)
+    elif mode == "replay":
+        adapter = ReplayAdapter(Cassette(cassette_dir), **pool)
+    else:
+        adapter = MockServerAdapter(mock_server, **pool)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
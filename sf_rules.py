@@ -0,0 +1,100 @@
+import json
+import re
+import pandas as pd
+
+# Declarative row-filter rules for the "Upsert API Field Attribute" sheet. A rule file is JSON:
+#
+#   {"rules": [
+#       {"name": "User allow-list", "when": [
+#           {"column": "Entity", "equals": "User"},
+#           {"column": "Field", "not_in": ["userId", "status", "username", "firstName", "lastName", "__metadata"]}
+#       ]}
+#   ]}
+#
+# A rule removes a row when all of its conditions hold; the first matching rule (in file order) is reported as
+# the reason. Each condition names a column (case-insensitive) and one test:
+#   "equals": value | "in": [values] | "not_in": [values] | "matches": regular expression | "blank": true/false
+# plus the optional modifiers "ignore_case" and "strip". Cell values are compared as text, empty cells as "".
+# Rules are compiled into pandas column predicates that are evaluated over the whole sheet at once.
+
+TESTS = ("equals", "in", "not_in", "matches", "blank")
+
+def load_rules(path):
+    with open(path, encoding="utf-8") as f:
+        rules = json.load(f)
+    return rules["rules"] if isinstance(rules, dict) else rules
+
+def compile_condition(rule_name, condition):
+    tests = [test for test in TESTS if test in condition]
+    if "column" not in condition or len(tests) != 1:
+        raise ValueError(f"rule {rule_name!r}: every condition needs a column and exactly one of {TESTS}: {condition}")
+    test = tests[0]
+    column = condition["column"].lower()
+    flags = re.IGNORECASE if condition.get("ignore_case", False) and test == "matches" else 0
+    ignore_case = condition.get("ignore_case", False) and test != "matches"  # Patterns use re.IGNORECASE instead
+    strip = condition.get("strip", False)
+
+    def normalize(value):
+        value = str(value)
+        value = value.strip() if strip else value
+        return value.lower() if ignore_case else value
+
+    expected = condition[test]
+    if test in ("in", "not_in"):
+        expected = [normalize(value) for value in expected]
+    elif test == "equals":
+        expected = normalize(expected)
+    elif test == "matches":
+        re.compile(expected)  # Report a bad pattern when the rules are compiled
+
+    def predicate(table):
+        if column not in table:
+            raise ValueError(f"rule {rule_name!r}: column {condition['column']!r} is not in the sheet")
+        values = table[column]
+        if strip:
+            values = values.str.strip()
+        if ignore_case:
+            values = values.str.lower()
+        if test == "equals":
+            return values == expected
+        if test == "in":
+            return values.isin(expected)
+        if test == "not_in":
+            return ~values.isin(expected)
+        if test == "matches":
+            return values.str.fullmatch(expected, flags=flags)
+        return (values == "") == bool(expected)
+    return predicate
+
+def compile_rules(rules):
+    """[(name, predicate)] where predicate(table) returns the boolean mask of the rows the rule removes."""
+    compiled = []
+    for i, rule in enumerate(rules):
+        name = rule.get("name") or f"rule {i + 1}"
+        conditions = [compile_condition(name, condition) for condition in rule.get("when", [])]
+        if not conditions:
+            raise ValueError(f"rule {name!r} has no conditions")
+
+        def predicate(table, conditions=conditions):
+            mask = conditions[0](table)
+            for condition in conditions[1:]:
+                mask &= condition(table)
+            return mask
+        compiled.append((name, predicate))
+    return compiled
+
+def field_table(headers, rows):
+    # Rows as a DataFrame of text columns keyed by lowercase header; empty cells (None, "", False, 0) become ""
+    table = pd.DataFrame([list(row) for row in rows], columns=[str(h).lower() if h else "" for h in headers], dtype=object)
+    table = table.loc[:, ~table.columns.duplicated()]
+    return table.apply(lambda column: column.astype(str).where(column.astype(bool), ""))
+
+def removal_reasons(compiled, headers, rows):
+    """Name of the first rule that removes each row, None for the rows that are kept."""
+    if not rows:
+        return []
+    table = field_table(headers, rows)
+    reasons = pd.Series([None] * len(table), index=table.index, dtype=object)
+    for name, predicate in compiled:
+        reasons = reasons.mask(reasons.isna() & predicate(table).astype(bool), name)
+    return reasons.tolist()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+import openpyxl
+
+# SQLite store used as the interchange between the four scripts. Every stage writes its tables here next to
+# its Excel output, and the next stage reads them instead of re-parsing the workbook. A table is only used
+# while it is at least as new as the workbook it mirrors, or the workbook's content hash is unchanged, so a
+# workbook edited by hand still takes precedence. Input workbooks no script writes (e.g. the attribute workbook)
+# are added to the store the first time they are read, so later runs do not parse them again either.
+
+# SQLite has no boolean type; booleans (e.g. JSON sample values) are stored as tagged text and restored on read
+_TRUE = "\x00bool:true"
+_FALSE = "\x00bool:false"
+
+def _encode(value):
+    if isinstance(value, bool):
+        return _TRUE if value else _FALSE
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+def _decode(value):
+    if value == _TRUE:
+        return True
+    if value == _FALSE:
+        return False
+    return value
+
+def _connect(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS _tables (name TEXT PRIMARY KEY, headers TEXT, written_at REAL, source_hash TEXT)")
+    if "source_hash" not in [row[1] for row in conn.execute("PRAGMA table_info(_tables)")]:
+        conn.execute("ALTER TABLE _tables ADD COLUMN source_hash TEXT")  # Store written before content hashes
+    return conn
+
+_hashes = {}
+
+def _file_hash(path):
+    # SHA-256 of a workbook, computed once per (path, mtime, size); None if it does not exist
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+    if key not in _hashes:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _table_name(workbook_path, sheet_name):
+    # Tables mirror one sheet of one workbook, e.g. "EC_APIField_Metadata.xlsx/EC Entity"
+    return f"{os.path.basename(workbook_path)}/{sheet_name}"
+
+def write_sheet(store_path, workbook_path, sheet_name, headers, rows):
+    """Stores a sheet as a table: the header list plus rows (sequences of cell values).
+
+    Call it after the workbook itself has been saved, so the table counts as current.
+    """
+    name = _table_name(workbook_path, sheet_name)
+    headers = list(headers)
+    columns = [f"c{i}" for i in range(max(1, len(headers)))]
+    with closing(_connect(store_path)) as conn, conn:
+        conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        conn.execute(f"CREATE TABLE {_quote(name)} ({', '.join(columns)})")
+        insert = f"INSERT INTO {_quote(name)} VALUES ({', '.join('?' * len(columns))})"
+        conn.executemany(insert, (
+            [_encode(row[i]) if i < len(row) else None for i in range(len(columns))] for row in rows
+        ))
+        conn.execute("INSERT OR REPLACE INTO _tables VALUES (?, ?, ?, ?)",
+                     (name, json.dumps(headers), time.time(), _file_hash(workbook_path)))
+
+def read_sheet(store_path, workbook_path, sheet_name):
+    """Returns (headers, rows) of a stored sheet.
+
+    None means the table is missing or the workbook was changed after it, and the caller should read the workbook.
+    A workbook saved later with the same content (same SHA-256) still counts as unchanged.
+    """
+    if not os.path.exists(store_path):
+        return None
+    name = _table_name(workbook_path, sheet_name)
+    with closing(_connect(store_path)) as conn:
+        meta = conn.execute("SELECT headers, written_at, source_hash FROM _tables WHERE name = ?", (name,)).fetchone()
+        if meta is None:
+            return None
+        if os.path.exists(workbook_path) and os.path.getmtime(workbook_path) > meta[1]:
+            if meta[2] is None or _file_hash(workbook_path) != meta[2]:
+                return None
+            with conn:
+                conn.execute("UPDATE _tables SET written_at = ? WHERE name = ?", (time.time(), name))  # Skip the hash next time
+        headers = json.loads(meta[0])
+        rows = [
+            [_decode(value) for value in row[:len(headers)]]
+            for row in conn.execute(f"SELECT * FROM {_quote(name)} ORDER BY rowid")
+        ]
+    return headers, rows
+
+def load_sheet(store_path, workbook_path, sheet_name):
+    """(headers, rows) of a sheet, from the store when it is current and from the workbook otherwise.
+
+    A sheet read from the workbook (streamed in read-only mode) is written to the store, so the next run reuses it
+    until the workbook changes.
+    """
+    stored = read_sheet(store_path, workbook_path, sheet_name)
+    if stored is not None:
+        return stored
+    wb = openpyxl.load_workbook(workbook_path, read_only=True, data_only=True)
+    try:
+        rows = [list(row) for row in wb[sheet_name].iter_rows(values_only=True)]
+    finally:
+        wb.close()
+    headers = rows[0] if rows else []
+    write_sheet(store_path, workbook_path, sheet_name, headers, rows[1:])
+    return headers, rows[1:]
@@ -0,0 +1,65 @@
+from copy import copy
+from openpyxl.styles import NamedStyle, PatternFill, Border, Side, Alignment
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter
+
+# Sheet formatting shared by the scripts: a bordered header with a green fill, bordered body cells and column
+# widths fitted to the content. Both looks are registered once per workbook as NamedStyles, so every cell only
+# refers to a style instead of carrying its own border and fill.
+
+THIN = Side(border_style="thin", color="000000")
+BORDER = Border(left=THIN, right=THIN, top=THIN, bottom=THIN)
+BODY_STYLE = "SF Body"
+
+def register_styles(wb, header_color="00FF00", bold_header=False):
+    # (header style name, body style name), added to the workbook on first use. bold_header gives the header the
+    # bold, centred text pandas writes, for sheets that were written with DataFrame.to_excel before.
+    header_style = f"SF Header {header_color}" + (" Bold" if bold_header else "")
+    if header_style not in wb.named_styles:
+        fill = PatternFill(start_color=header_color, end_color=header_color, fill_type="solid")
+        font = copy(DEFAULT_FONT)
+        alignment = Alignment()
+        if bold_header:
+            font.b = True
+            alignment = Alignment(horizontal="center", vertical="top")
+        wb.add_named_style(NamedStyle(name=header_style, font=font, border=BORDER, fill=fill, alignment=alignment))
+    if BODY_STYLE not in wb.named_styles:
+        wb.add_named_style(NamedStyle(name=BODY_STYLE, font=copy(DEFAULT_FONT), border=BORDER))
+    return header_style, BODY_STYLE
+
+def apply_style(cell, style, fill=None):
+    # A cell that already carries formatting (e.g. from a loaded workbook) keeps its font, number format, alignment
+    # and protection: it only gets the border and, as a header, the fill instead of the named style
+    if not cell.has_style:
+        cell.style = style
+        return
+    cell.border = BORDER
+    if fill is not None:
+        cell.fill = fill
+
+def autofit_and_style(ws, header_color="00FF00", row_height=None, fill_empty_header=False):
+    """Styles the used range of a sheet in a single pass over its cells.
+
+    Header cells with a value (all header cells with fill_empty_header) get the header style, all other cells
+    the bordered body style. Each column is as wide as its longest value plus 2, and with row_height every row
+    holding a value gets that height.
+    """
+    header_style, body_style = register_styles(ws.parent, header_color)
+    header_fill = PatternFill(start_color=header_color, end_color=header_color, fill_type="solid")
+    widths = {}
+    for row in ws.iter_rows():
+        has_value = False
+        for cell in row:
+            value = cell.value
+            is_header = cell.row == 1 and (value or fill_empty_header)
+            if is_header:
+                apply_style(cell, header_style, header_fill)
+            else:
+                apply_style(cell, body_style)
+            if value:
+                has_value = True
+                widths[cell.column] = max(widths.get(cell.column, 0), len(str(value)))
+        if row_height and has_value:
+            ws.row_dimensions[row[0].row].height = row_height
+    for column in range(ws.min_column, ws.max_column + 1):
+        ws.column_dimensions[get_column_letter(column)].width = widths.get(column, 0) + 2
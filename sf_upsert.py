@@ -0,0 +1,178 @@
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+# Ordering of new-hire upserts. SuccessFactors rejects a record whose parent does not exist yet (no PerPerson
+# without its User, no EmpJob without its EmpEmployment), so the entities are posted along a dependency graph:
+# an entity starts once every parent entity was upserted, entities without an order between them run
+# concurrently, and the dependents of a failed upsert are skipped instead of being sent.
+#
+# Dependencies are configured as {entity or fnmatch pattern: [parent entities]}, e.g.
+#   {"PerPerson": ["User"], "EmpEmployment": ["PerPerson"], "Per*": ["EmpEmployment"]}
+# An exact entity name wins over the patterns, which are tried in order; entities matching nothing have no parents.
+
+def entity_parents(entity, dependencies):
+    if entity in dependencies:
+        return list(dependencies[entity])
+    for pattern, parents in dependencies.items():
+        if fnmatch.fnmatchcase(entity, pattern):
+            return list(parents)
+    return []
+
+def dependency_graph(entities, dependencies):
+    """{entity: parent entities} for the entities that are upserted.
+
+    A parent that is not upserted itself is replaced by its own parents, so EmpJob still waits for PerPerson
+    when there is no EmpEmployment body.
+    """
+    present = set(entities)
+    graph = {}
+    for entity in entities:
+        parents = []
+        seen = {entity}
+        pending = entity_parents(entity, dependencies)
+        while pending:
+            parent = pending.pop(0)
+            if parent in seen:
+                continue
+            seen.add(parent)
+            if parent in present:
+                parents.append(parent)
+            else:
+                pending.extend(entity_parents(parent, dependencies))
+        graph[entity] = parents
+    return graph
+
+def dependency_levels(graph):
+    """Entities grouped into levels whose members only depend on earlier levels; ValueError on a cycle."""
+    levels = []
+    placed = set()
+    while len(placed) < len(graph):
+        level = [entity for entity in graph if entity not in placed and all(p in placed for p in graph[entity])]
+        if not level:
+            raise ValueError(f"Upsert dependencies form a cycle between {sorted(set(graph) - placed)}")
+        levels.append(level)
+        placed.update(level)
+    return levels
+
+def upsert_succeeded(response):
+    # The upsert answers 200 even when records are rejected; each record of "d" carries its own status
+    if response.status_code >= 400:
+        return False
+    try:
+        results = response.json().get("d", [])
+    except (ValueError, AttributeError):
+        return True
+    results = results if isinstance(results, list) else [results]
+    return not any(isinstance(r, dict) and str(r.get("status", "")).upper() == "ERROR" for r in results)
+
+def run_in_dependency_order(tasks, graph, run, max_workers):
+    """Runs run(task) for every (entity, task) pair, up to max_workers at once, and yields (task, ok, result).
+
+    run returns (ok, result). The tasks of an entity start once all tasks of its parent entities succeeded. When
+    a task fails, the tasks of every entity depending on it are yielded with ok None and a "Skipped: ..." result
+    without being run. Results are yielded in completion order.
+    """
+    dependency_levels(graph)  # Reject a cycle before anything is sent
+    waiting = {}
+    for entity, task in tasks:
+        waiting.setdefault(entity, []).append(task)
+    state = {entity: "waiting" for entity in waiting}
+    remaining = {entity: len(entity_tasks) for entity, entity_tasks in waiting.items()}
+    failed_by = {}  # Entity -> the failed entity it was skipped for
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while True:
+            changed = True
+            while changed:
+                changed = False
+                for entity, entity_tasks in waiting.items():
+                    if state[entity] != "waiting":
+                        continue
+                    parents = [p for p in graph.get(entity, []) if p in state]
+                    blocked = next((p for p in parents if state[p] == "failed"), None)
+                    if blocked is not None:
+                        state[entity] = "failed"
+                        failed_by[entity] = failed_by.get(blocked, blocked)
+                        changed = True
+                        for task in entity_tasks:
+                            yield task, None, f"Skipped: {failed_by[entity]} upsert failed"
+                    elif all(state[p] == "ok" for p in parents):
+                        state[entity] = "running"
+                        for task in entity_tasks:
+                            running[pool.submit(run, task)] = (entity, task)
+            if not running:
+                return
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                entity, task = running.pop(future)
+                try:
+                    ok, result = future.result()
+                except Exception as e:
+                    ok, result = False, f"Error: {e}"
+                if not ok:
+                    state[entity] = "failed"
+                remaining[entity] -= 1
+                if remaining[entity] == 0 and state[entity] == "running":
+                    state[entity] = "ok"
+                yield task, ok, result
+
+def record_results(response, count):
+    """(ok, message) for each of the count records of an array upsert, mapped through the "index" of each result.
+
+    Records without a result in the response are reported as failed, since their upsert cannot be confirmed.
+    """
+    if response.status_code >= 400:
+        return [(False, f"HTTP {response.status_code}: {response.text}")] * count
+    try:
+        results = response.json().get("d", [])
+    except (ValueError, AttributeError):
+        return [(False, f"Unreadable upsert response: {response.text}")] * count
+    results = results if isinstance(results, list) else [results]
+    mapped = [(False, "No result for this record in the upsert response")] * count
+    for position, result in enumerate(results):
+        if not isinstance(result, dict):
+            continue
+        index = result.get("index")
+        index = index if isinstance(index, int) and 0 <= index < count else position
+        if index < count:
+            ok = str(result.get("status", "")).upper() != "ERROR"
+            mapped[index] = (ok, result.get("message") or result.get("editStatus") or result.get("status") or "")
+    return mapped
+
+def run_batched_upserts(records, graph, post, batch_size, max_workers):
+    """Upserts records [(owner, entity, body)] as array payloads and yields (owner, entity, ok, message) per record.
+
+    The entities are sent level by level (see dependency_levels), each entity's bodies in payloads of up to
+    batch_size records and up to max_workers payloads at once; post(bodies) returns the upsert response. Owners
+    (e.g. the hires) are tracked separately: a record whose owner has a failed or skipped parent record is yielded
+    with ok None and a "Skipped: ..." message without being sent, while the other owners go on.
+    """
+    by_entity = {}
+    for owner, entity, body in records:
+        by_entity.setdefault(entity, []).append((owner, body))
+    failed_by = {}  # (owner, entity) -> the entity whose upsert failed for that owner
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for level in dependency_levels(graph):
+            futures = {}
+            for entity in level:
+                to_send = []
+                for owner, body in by_entity.get(entity, []):
+                    blocked = next((p for p in graph[entity] if (owner, p) in failed_by), None)
+                    if blocked is not None:
+                        failed_by[(owner, entity)] = failed_by[(owner, blocked)]
+                        yield owner, entity, None, f"Skipped: {failed_by[(owner, entity)]} upsert failed"
+                    else:
+                        to_send.append((owner, body))
+                for start in range(0, len(to_send), max(1, batch_size)):
+                    batch = to_send[start:start + max(1, batch_size)]
+                    futures[pool.submit(post, [body for _, body in batch])] = (entity, batch)
+            for future in as_completed(futures):
+                entity, batch = futures[future]
+                try:
+                    results = record_results(future.result(), len(batch))
+                except Exception as e:
+                    results = [(False, f"Error: {e}")] * len(batch)
+                for (owner, _), (ok, message) in zip(batch, results):
+                    if not ok:
+                        failed_by[(owner, entity)] = entity
+                    yield owner, entity, ok, message